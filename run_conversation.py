@@ -1,7 +1,14 @@
 # Import pipeline, AutoTokenizer, and torch
 from transformers import pipeline, AutoTokenizer
 import torch
+import torch.nn.functional as F
 import os
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -10,6 +17,520 @@ print("Model: microsoft/DialoGPT-medium")
 print("Note: Using text-generation pipeline with manual history.")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the original pipeline-based dialogue below.
+parser = argparse.ArgumentParser(description="Local DialoGPT dialogue example.")
+parser.add_argument("--kv-cache", action="store_true", help="Keep the model's key/value cache between turns and only feed new tokens.")
+parser.add_argument("--turns", type=int, help="Number of user turns to simulate, cycling through the scripted inputs (default: one pass).")
+parser.add_argument("--max-new-tokens", type=int, default=60, help="Maximum response length in tokens (default: 60).")
+parser.add_argument("--max-context-tokens", type=int, help="Token budget for the dialogue history; oldest turns are dropped to stay inside it (default: unlimited, or the model's context size with --kv-cache).")
+parser.add_argument("--serve", type=int, metavar="PORT", help="Run a multi-session chat server on this TCP port.")
+parser.add_argument("--host", default="127.0.0.1", help="Address for --serve (default: 127.0.0.1).")
+parser.add_argument("--simulate", type=int, metavar="N", help="Drive the batching server with N concurrent scripted sessions and report throughput/latency.")
+parser.add_argument("--compact-to", type=float, default=0.5, help="When the budget is exceeded, drop old turns until the history is this fraction of it (default: 0.5).")
+args = parser.parse_args()
+if not 0 < args.compact_to <= 1:
+    parser.error("--compact-to must be greater than 0 and at most 1")
+# ----------------------------
+
+# --- Token-budgeted History ---
+class TokenBudgetHistory:
+    """
+    Dialogue history kept as a queue of turns with their token ids.
+
+    Each turn is tokenized once when it is added and the running token count
+    is updated incrementally, so checking the budget never re-tokenizes the
+    history. When the next turn would not fit, whole turns are dropped from
+    the front until the history is back under the low-water mark; compacting
+    further than strictly needed means it happens rarely rather than on every
+    turn once the dialogue is long.
+    """
+
+    def __init__(self, tokenizer, budget, compact_to=0.5):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.low_water = int(budget * compact_to)
+        self.turns = collections.deque()
+        self.total_tokens = 0
+
+    def append(self, text, ids=None):
+        if ids is None:
+            ids = self.tokenizer.encode(text)
+        self.turns.append((text, ids))
+        self.total_tokens += len(ids)
+        return ids
+
+    def fits(self, extra_tokens):
+        return self.total_tokens + extra_tokens <= self.budget
+
+    def make_room(self, extra_tokens):
+        """Drop the oldest turns if extra_tokens more would overflow the budget; returns how many were dropped."""
+        if self.fits(extra_tokens):
+            return 0
+        dropped = 0
+        while self.turns and self.total_tokens + extra_tokens > self.low_water:
+            _, ids = self.turns.popleft()
+            self.total_tokens -= len(ids)
+            dropped += 1
+        return dropped
+
+    def ids(self):
+        return [token_id for _, ids in self.turns for token_id in ids]
+
+    def text(self):
+        return "".join(text for text, _ in self.turns)
+# ------------------------------
+
+# --- Cached Dialogue Session ---
+def legacy_cache(past_key_values):
+    """((key, value), ...) per layer, whether the model returned tuples or a Cache object."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def sample_next_token(logits, temperature=0.7, top_k=50):
+    """Top-k temperature sampling over the last position's logits (same settings as the pipeline call below)."""
+    logits = logits / temperature
+    top_logits, top_ids = torch.topk(logits, min(top_k, logits.shape[-1]), dim=-1)
+    choice = torch.multinomial(torch.softmax(top_logits, dim=-1), num_samples=1)
+    return top_ids.gather(-1, choice)
+
+
+class DialogueSession:
+    """
+    Multi-turn DialoGPT conversation that reuses past_key_values between turns.
+
+    Each turn only runs the model over the tokens that are not in the cache
+    yet (the end of the previous reply plus the new user message), then
+    decodes the reply one token at a time against the cache. The history is
+    never re-encoded, so the cost of a turn no longer grows with the length
+    of the conversation.
+
+    With a TokenBudgetHistory the session also stays inside the model's
+    context window: when a turn would overflow the budget, old turns are
+    dropped and the cache is rebuilt once from the retained history
+    (GPT-2 positions are absolute, so cache entries can't be trimmed in place).
+    """
+
+    def __init__(self, model, tokenizer, max_new_tokens=60, temperature=0.7, top_k=50, history=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.history = history
+        self.past_key_values = None
+        # Tokens that belong to the dialogue but have not been run through the model yet
+        self.pending_ids = []
+        self.cached_length = 0
+        self.last_dropped_turns = 0
+
+    @torch.no_grad()
+    def forward(self, token_ids):
+        input_ids = torch.tensor([token_ids], device=self.model.device)
+        outputs = self.model(input_ids=input_ids, past_key_values=self.past_key_values, use_cache=True)
+        self.past_key_values = outputs.past_key_values
+        self.cached_length += len(token_ids)
+        return outputs.logits[0, -1]
+
+    def begin_turn(self, user_text):
+        """Prefill the uncached tokens plus the new user message; returns the logits for the first reply token."""
+        eos_id = self.tokenizer.eos_token_id
+        user_ids = self.tokenizer.encode(user_text) + [eos_id]
+        self.last_dropped_turns = 0
+        if self.history is not None:
+            self.last_dropped_turns = self.history.make_room(len(user_ids) + self.max_new_tokens)
+            if self.last_dropped_turns:
+                # Re-prefill from the retained turns; this costs at most one budget's worth of tokens
+                self.past_key_values = None
+                self.cached_length = 0
+                self.pending_ids = self.history.ids()
+            self.history.append(user_text + self.tokenizer.eos_token, user_ids)
+        new_ids = self.pending_ids + user_ids
+        self.pending_ids = []
+        return self.forward(new_ids)
+
+    def finish_turn(self, reply_ids):
+        """Record a finished reply (all of whose tokens are already in the cache) and return its text."""
+        eos_id = self.tokenizer.eos_token_id
+        # The closing EOS is fed together with the next user message
+        self.pending_ids = [eos_id]
+        reply_text = self.tokenizer.decode(reply_ids, skip_special_tokens=True)
+        if self.history is not None:
+            self.history.append(reply_text + self.tokenizer.eos_token, reply_ids + [eos_id])
+        return reply_text.strip()
+
+    def respond(self, user_text):
+        logits = self.begin_turn(user_text)
+        reply_ids = []
+        for _ in range(self.max_new_tokens):
+            next_id = sample_next_token(logits, self.temperature, self.top_k).item()
+            if next_id == self.tokenizer.eos_token_id:
+                break
+            reply_ids.append(next_id)
+            logits = self.forward([next_id])
+        return self.finish_turn(reply_ids)
+
+    def kv_bytes(self):
+        if self.past_key_values is None:
+            return 0
+        return sum(k.numel() * k.element_size() + v.numel() * v.element_size()
+                   for k, v in legacy_cache(self.past_key_values))
+
+
+def run_cached_dialogue(session, user_inputs, turns):
+    print("\n--- Starting Dialogue Simulation (KV cache) ---")
+    for turn in range(turns):
+        user_text = user_inputs[turn % len(user_inputs)]
+        print(f"\nUser >>> {user_text}")
+        start = time.perf_counter()
+        response_text = session.respond(user_text)
+        elapsed = time.perf_counter() - start
+        print(f"Bot >>> {response_text or '(Model generated empty response)'}")
+        compacted = f", dropped {session.last_dropped_turns} old turns" if session.last_dropped_turns else ""
+        print(f"(turn {turn + 1}: {1000 * elapsed:.0f} ms, {session.cached_length} tokens in cache{compacted})")
+        print("--------------------")
+    print("\n--- Dialogue Finished ---")
+# -------------------------------
+
+# --- Multi-session Chat Server ---
+class BatchRow:
+    """One session that is currently generating a reply inside the shared batch."""
+
+    def __init__(self, session, stream, first_id):
+        self.session = session
+        self.stream = stream
+        self.reply_ids = [first_id]
+        self.next_id = first_id
+
+
+class ContinuousBatcher:
+    """
+    Runs one decode step at a time for every session that is generating a reply.
+
+    All active sessions share one left-padded key/value cache and attention
+    mask. Between steps, new requests are prefilled on their own session
+    cache and merged into the batch, and sessions that hit EOS or their token
+    limit are split back out (their cache row becomes the session's KV state
+    again). The batch therefore changes membership at every step instead of
+    waiting for the slowest reply to finish.
+    """
+
+    def __init__(self, model, eos_id, max_new_tokens, temperature=0.7, top_k=50):
+        self.model = model
+        self.eos_id = eos_id
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.rows = []
+        self.cache = None  # legacy ((key, value), ...) tuples of shape [batch, heads, length, head_dim]
+        self.mask = None   # [batch, length], 0 on left padding
+        # Appended from the event loop, consumed by step() in the worker thread (deque ops are thread-safe)
+        self.waiting = collections.deque()
+        self.steps = 0
+        self.batched_tokens = 0
+
+    def busy(self):
+        return bool(self.rows or self.waiting)
+
+    def submit(self, session, user_text, stream):
+        self.waiting.append((session, user_text, stream))
+
+    def reset(self):
+        """Drop every active and waiting request (after a failed step); returns their streams."""
+        streams = [row.stream for row in self.rows] + [stream for _, _, stream in self.waiting]
+        self.rows = []
+        self.waiting.clear()
+        self.cache = self.mask = None
+        return streams
+
+    def _merge(self, session):
+        """Left-pad the session's cache and the batch cache to a common length and stack them."""
+        row_cache = legacy_cache(session.past_key_values)
+        row_length = row_cache[0][0].shape[2]
+        if self.cache is None:
+            self.cache = row_cache
+            self.mask = torch.ones((1, row_length), dtype=torch.long, device=self.model.device)
+            return
+        batch_length = self.cache[0][0].shape[2]
+        length = max(batch_length, row_length)
+        pad_batch, pad_row = length - batch_length, length - row_length
+        self.cache = tuple(
+            (torch.cat([F.pad(k, (0, 0, pad_batch, 0)), F.pad(rk, (0, 0, pad_row, 0))]),
+             torch.cat([F.pad(v, (0, 0, pad_batch, 0)), F.pad(rv, (0, 0, pad_row, 0))]))
+            for (k, v), (rk, rv) in zip(self.cache, row_cache)
+        )
+        row_mask = torch.ones((1, length), dtype=torch.long, device=self.model.device)
+        row_mask[:, :pad_row] = 0
+        self.mask = torch.cat([F.pad(self.mask, (pad_batch, 0)), row_mask])
+
+    def _split(self, finished):
+        """Hand finished rows their own (unpadded) cache back and drop them from the batch."""
+        for i in finished:
+            length = self.rows[i].session.cached_length
+            self.rows[i].session.past_key_values = tuple(
+                (k[i:i + 1, :, -length:].clone(), v[i:i + 1, :, -length:].clone()) for k, v in self.cache)
+        keep = [i for i in range(len(self.rows)) if i not in set(finished)]
+        self.rows = [self.rows[i] for i in keep]
+        if not self.rows:
+            self.cache = self.mask = None
+            return
+        index = torch.tensor(keep, device=self.model.device)
+        self.mask = self.mask.index_select(0, index)
+        # Columns that are padding for every remaining row can go
+        start = int((self.mask.sum(dim=0) == 0).long().cumprod(dim=0).sum())
+        self.mask = self.mask[:, start:]
+        self.cache = tuple((k.index_select(0, index)[:, :, start:], v.index_select(0, index)[:, :, start:])
+                           for k, v in self.cache)
+
+    @torch.no_grad()
+    def step(self):
+        """Admit waiting requests, run one batched decode step, retire finished rows; returns stream events."""
+        events = []
+        finished = []
+        # 1. Join: prefill each new request on its own cache, sample its first token, merge it in
+        while self.waiting:
+            session, user_text, stream = self.waiting.popleft()
+            try:
+                logits = session.begin_turn(user_text)
+            except Exception as e:
+                events.append((stream, "error", str(e)))
+                continue
+            first_id = sample_next_token(logits, self.temperature, self.top_k).item()
+            if first_id == self.eos_id:
+                events.append((stream, "done", session.finish_turn([])))
+                continue
+            self._merge(session)
+            self.rows.append(BatchRow(session, stream, first_id))
+            events.append((stream, "token", first_id))
+        if not self.rows:
+            return events
+
+        # 2. One forward pass over the last token of every active row
+        input_ids = torch.tensor([[row.next_id] for row in self.rows], device=self.model.device)
+        position_ids = torch.tensor([[row.session.cached_length] for row in self.rows], device=self.model.device)
+        self.mask = F.pad(self.mask, (0, 1), value=1)
+        outputs = self.model(input_ids=input_ids, position_ids=position_ids, attention_mask=self.mask,
+                             past_key_values=self.cache, use_cache=True)
+        self.cache = legacy_cache(outputs.past_key_values)
+        self.steps += 1
+        self.batched_tokens += len(self.rows)
+        next_ids = sample_next_token(outputs.logits[:, -1], self.temperature, self.top_k)[:, 0].tolist()
+
+        # 3. Leave: rows that reached their limit or sampled EOS are split out before the next step
+        for i, (row, next_id) in enumerate(zip(self.rows, next_ids)):
+            row.session.cached_length += 1
+            if len(row.reply_ids) >= self.max_new_tokens or next_id == self.eos_id:
+                finished.append(i)
+                continue
+            row.reply_ids.append(next_id)
+            row.next_id = next_id
+            events.append((row.stream, "token", next_id))
+        for i in finished:
+            events.append((self.rows[i].stream, "done", self.rows[i].session.finish_turn(self.rows[i].reply_ids)))
+        if finished:
+            self._split(finished)
+        return events
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ChatServer:
+    """
+    asyncio front end around a ContinuousBatcher.
+
+    Each chat request gets an asyncio.Queue that receives ("token", text)
+    events as they are decoded and a final ("done", reply). Model steps run
+    in a worker thread so the event loop stays responsive while the batch
+    is decoding.
+    """
+
+    def __init__(self, model, tokenizer, args):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.args = args
+        self.batcher = ContinuousBatcher(model, tokenizer.eos_token_id, args.max_new_tokens)
+        self.sessions = {}
+        self.busy_sessions = set()
+        self.wakeup = asyncio.Event()
+        self.last_token_time = {}
+        self.inter_token_gaps = []
+        self.generated_tokens = 0
+        self.sessions_served = 0
+        self.started = time.perf_counter()
+
+    def get_session(self, session_id):
+        if session_id not in self.sessions:
+            self.sessions_served += 1
+            budget = self.args.max_context_tokens or self.model.config.max_position_embeddings
+            history = TokenBudgetHistory(self.tokenizer, budget, self.args.compact_to)
+            self.sessions[session_id] = DialogueSession(self.model, self.tokenizer, self.args.max_new_tokens, history=history)
+        return self.sessions[session_id]
+
+    def chat(self, session_id, user_text):
+        """Queue a user message for a session; returns the asyncio.Queue its reply is streamed to."""
+        if session_id in self.busy_sessions:
+            raise ValueError(f"Session {session_id} is already generating a reply")
+        stream = asyncio.Queue()
+        self.busy_sessions.add(session_id)
+        stream.session_id = session_id
+        self.batcher.submit(self.get_session(session_id), user_text, stream)
+        self.wakeup.set()
+        return stream
+
+    def close_session(self, session_id):
+        """Forget an idle session and free its KV cache."""
+        if session_id in self.busy_sessions:
+            raise ValueError(f"Session {session_id} is generating a reply")
+        return self.sessions.pop(session_id, None) is not None
+
+    def session_info(self):
+        """Per-session KV state: cached tokens, history size and cache memory."""
+        return {
+            session_id: {
+                "cached_tokens": session.cached_length,
+                "history_tokens": session.history.total_tokens,
+                "turns": len(session.history.turns),
+                "kv_bytes": session.kv_bytes(),
+                "generating": session_id in self.busy_sessions,
+            }
+            for session_id, session in self.sessions.items()
+        }
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "active_sessions": len(self.sessions),
+            "sessions_served": self.sessions_served,
+            "generated_tokens": self.generated_tokens,
+            "tokens_per_sec": self.generated_tokens / elapsed if elapsed > 0 else 0.0,
+            "decode_steps": self.batcher.steps,
+            "mean_batch_size": self.batcher.batched_tokens / self.batcher.steps if self.batcher.steps else 0.0,
+            "inter_token_p50_ms": 1000 * percentile(self.inter_token_gaps, 0.50),
+            "inter_token_p99_ms": 1000 * percentile(self.inter_token_gaps, 0.99),
+        }
+
+    async def run_scheduler(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.batcher.busy():
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            try:
+                events = await loop.run_in_executor(None, self.batcher.step)
+            except Exception as e:
+                # The affected sessions' caches are in an unknown state: fail their requests and drop them
+                events = [(stream, "error", str(e)) for stream in self.batcher.reset()]
+                for stream, _, _ in events:
+                    self.sessions.pop(stream.session_id, None)
+            now = time.perf_counter()
+            for stream, kind, payload in events:
+                session_id = stream.session_id
+                if kind == "token":
+                    self.generated_tokens += 1
+                    if session_id in self.last_token_time:
+                        self.inter_token_gaps.append(now - self.last_token_time[session_id])
+                    self.last_token_time[session_id] = now
+                    payload = self.tokenizer.decode([payload])
+                else:
+                    self.last_token_time.pop(session_id, None)
+                    self.busy_sessions.discard(session_id)
+                stream.put_nowait((kind, payload))
+
+    async def handle_client(self, reader, writer):
+        """
+        Line-delimited JSON protocol, one request per line:
+          {"session": "abc", "text": "Hi!"}  -> {"token": ...} lines, then {"done": true, "reply": ...}
+          {"session": "abc", "close": true}  -> {"closed": true/false}
+          {"sessions": true} / {"stats": true}
+        """
+        async def send(message):
+            writer.write((json.dumps(message) + "\n").encode("utf-8"))
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if request.get("stats"):
+                        await send(self.stats())
+                    elif request.get("sessions"):
+                        await send(self.session_info())
+                    elif request.get("close"):
+                        await send({"closed": self.close_session(str(request["session"]))})
+                    else:
+                        stream = self.chat(str(request["session"]), request["text"])
+                        while True:
+                            kind, payload = await stream.get()
+                            if kind == "done":
+                                await send({"done": True, "reply": payload})
+                                break
+                            if kind == "error":
+                                await send({"error": payload})
+                                break
+                            await send({"token": payload})
+                except KeyError as e:
+                    await send({"error": f"missing field {e}"})
+                except ValueError as e:
+                    await send({"error": str(e)})
+        finally:
+            writer.close()
+
+
+def print_server_report(server):
+    stats = server.stats()
+    print("\n--- Chat Server Report ---")
+    print(f"Sessions served:         {stats['sessions_served']} ({stats['active_sessions']} still open)")
+    print(f"Generated tokens:        {stats['generated_tokens']}")
+    print(f"Throughput:              {stats['tokens_per_sec']:.1f} tokens/sec")
+    print(f"Decode steps:            {stats['decode_steps']} (mean batch size {stats['mean_batch_size']:.1f})")
+    print(f"Inter-token latency p50: {stats['inter_token_p50_ms']:.1f} ms")
+    print(f"Inter-token latency p99: {stats['inter_token_p99_ms']:.1f} ms")
+    print("--------------------------")
+
+
+async def simulate_clients(server, num_sessions, user_inputs, turns):
+    """Drive the server with concurrent scripted sessions that join and leave at different times."""
+    scheduler = asyncio.create_task(server.run_scheduler())
+
+    async def client(session_id):
+        await asyncio.sleep(random.uniform(0, 0.5))
+        for turn in range(turns):
+            stream = server.chat(session_id, user_inputs[turn % len(user_inputs)])
+            while True:
+                kind, payload = await stream.get()
+                if kind == "error":
+                    raise RuntimeError(payload)
+                if kind == "done":
+                    break
+            # Think time between turns, so sessions keep joining and leaving the batch
+            await asyncio.sleep(random.uniform(0, 0.2))
+        server.close_session(session_id)
+
+    server.started = time.perf_counter()
+    await asyncio.gather(*(client(f"sim-{i}") for i in range(num_sessions)))
+    scheduler.cancel()
+    print_server_report(server)
+
+
+async def serve(server, host, port):
+    scheduler = asyncio.create_task(server.run_scheduler())
+    tcp_server = await asyncio.start_server(server.handle_client, host, port)
+    print(f"\nChat server listening on {host}:{port} (line-delimited JSON, Ctrl+C to stop)")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        scheduler.cancel()
+        print_server_report(server)
+# ---------------------------------
+
 # Define Model name
 model_name = "microsoft/DialoGPT-medium"
 
@@ -47,12 +568,52 @@ user_inputs = [
 dialogue_history_string = ""
 # --------------------------------
 
+# Optional token budget for the history; the KV-cache session always needs one,
+# because positions past the model's context size do not exist
+max_positions = generator.model.config.max_position_embeddings
+if args.max_context_tokens and args.max_context_tokens > max_positions:
+    parser.error(f"--max-context-tokens can be at most {max_positions}, the context size of {model_name}")
+history = None
+if args.max_context_tokens or args.kv_cache:
+    budget = args.max_context_tokens or max_positions
+    history = TokenBudgetHistory(tokenizer, budget, args.compact_to)
+
+if args.serve or args.simulate:
+    generator.model.eval()
+    server = ChatServer(generator.model, tokenizer, args)
+    try:
+        if args.simulate:
+            asyncio.run(simulate_clients(server, args.simulate, user_inputs, args.turns or len(user_inputs)))
+        else:
+            asyncio.run(serve(server, args.host, args.serve))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"\nError in chat server: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.kv_cache:
+    try:
+        session = DialogueSession(generator.model, tokenizer, max_new_tokens=args.max_new_tokens, history=history)
+        run_cached_dialogue(session, user_inputs, args.turns or len(user_inputs))
+    except Exception as e:
+        print(f"\nError during dialogue generation: {e}")
+    print("\nExample finished.")
+    exit()
+
 # --- Simulate Conversation ---
 print("\n--- Starting Dialogue Simulation ---")
 try:
     for i, user_text in enumerate(user_inputs):
         print(f"\nUser >>> {user_text}")
 
+        # Keep the history inside the token budget (only the new turn is tokenized)
+        if history is not None:
+            user_ids = tokenizer.encode(user_text + tokenizer.eos_token)
+            history.make_room(len(user_ids) + args.max_new_tokens)
+            dialogue_history_string = history.text()
+
         # Construct the prompt by appending the new user input and EOS token
         # The EOS token signals the end of a turn for DialoGPT
         prompt = dialogue_history_string + user_text + tokenizer.eos_token
@@ -62,7 +623,7 @@ try:
         # pad_token_id is often needed to suppress warnings during generation
         generated_sequences = generator(
             prompt,
-            max_new_tokens=60,  # Adjust max response length as needed
+            max_new_tokens=args.max_new_tokens,  # Adjust max response length as needed
             pad_token_id=tokenizer.eos_token_id,
             do_sample=True, # Add some randomness
             temperature=0.7,
@@ -88,6 +649,9 @@ try:
 
         # Update the dialogue history string for the next turn
         dialogue_history_string = full_generated_text + tokenizer.eos_token
+        if history is not None:
+            history.append(user_text + tokenizer.eos_token, user_ids)
+            history.append(full_generated_text[len(prompt):] + tokenizer.eos_token)
 
 
     print("\n--- Dialogue Finished ---")
@@ -1,6 +1,15 @@
 # Import the SentenceTransformer class, utility functions, and torch
 from sentence_transformers import SentenceTransformer, util
 import torch
+import numpy as np
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Ecosystem Example")
@@ -9,6 +18,977 @@ print("Library: sentence-transformers")
 print("Model: all-MiniLM-L6-v2")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the small in-memory example below.
+# Pass --store to keep corpus embeddings on disk between runs instead of re-encoding them.
+parser = argparse.ArgumentParser(description="Local semantic similarity search example.")
+parser.add_argument("--store", help="Directory of a persistent embedding store (created if missing).")
+parser.add_argument("--add", help="Store mode: append documents from a JSONL ({\"id\", \"text\"}) or plain text file.")
+parser.add_argument("--delete", nargs="+", default=[], help="Store mode: document ids to tombstone.")
+parser.add_argument("--query", help="Store mode: query sentence (default: the example query below).")
+parser.add_argument("--queries-file", help="Store mode: answer every line of this file as a query (batch search).")
+parser.add_argument("--output", help="Store mode: JSONL file for --queries-file results.")
+parser.add_argument("--query-block", type=int, default=1024, help="Batch search: queries multiplied per block (default: 1024).")
+parser.add_argument("--corpus-block", type=int, default=16384, help="Batch search: corpus rows per block (default: 16384).")
+parser.add_argument("--top-k", type=int, default=3, help="Number of results to return (default: 3).")
+parser.add_argument("--index", choices=["exact", "ivf", "int8", "binary", "hybrid"], default="exact", help="Store mode: search backend (default: exact).")
+parser.add_argument("--build-index", action="store_true", help="Store mode: (re)build the selected index before searching.")
+parser.add_argument("--nlist", type=int, help="IVF: number of k-means lists (default: 4 * sqrt(rows)).")
+parser.add_argument("--nprobe", type=int, default=8, help="IVF: lists scanned per query; higher = better recall, slower (default: 8).")
+parser.add_argument("--rescore", type=int, help="int8/binary: float-rescore this many candidates per result (default: 4 for int8, 10 for binary).")
+parser.add_argument("--shortlist", type=int, default=100, help="hybrid: BM25 candidates reranked with dense scores per query (default: 100).")
+parser.add_argument("--benchmark", type=int, metavar="N", help="Store mode: measure recall@k and latency of --index against exact search on N queries.")
+parser.add_argument("--workers", type=int, default=1, help="Store mode: encode --add documents with this many CPU worker processes (default: 1).")
+parser.add_argument("--threads-per-worker", type=int, help="Torch intra-op threads per worker (default: CPU cores / workers).")
+parser.add_argument("--shard-size", type=int, default=1024, help="Documents sent to a worker per task (default: 1024).")
+parser.add_argument("--scaling-report", action="store_true", help="Store mode: time encoding of the --add file with 1..--workers processes instead of storing it.")
+parser.add_argument("--scaling-sample", type=int, default=5000, help="Documents from --add used by --scaling-report (default: 5000).")
+parser.add_argument("--encode-batch-size", type=int, default=256, help="Documents encoded per model.encode call (default: 256).")
+args = parser.parse_args()
+if args.queries_file and not (args.store and args.output):
+    parser.error("--queries-file needs --store and --output")
+if args.scaling_report and not (args.store and args.add):
+    parser.error("--scaling-report needs --store and --add")
+# ----------------------------
+
+# --- Persistent Embedding Store ---
+def merge_top_k(best_scores, best_rows, scores, rows, top_k):
+    """Merge a new block of (scores, rows) into the running top-k without a full sort."""
+    if len(scores) > top_k:
+        keep = np.argpartition(-scores, top_k - 1)[:top_k]
+        scores, rows = scores[keep], rows[keep]
+    best_scores = np.concatenate([best_scores, scores])
+    best_rows = np.concatenate([best_rows, rows])
+    if len(best_scores) > top_k:
+        keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+        best_scores, best_rows = best_scores[keep], best_rows[keep]
+    return best_scores, best_rows
+
+
+def top_k_hits(best_scores, best_rows):
+    """Sort a merged top-k into util.semantic_search style hits, dropping tombstoned rows."""
+    order = np.argsort(-best_scores, kind="stable")
+    return [{"corpus_id": int(best_rows[i]), "score": float(best_scores[i])}
+            for i in order if np.isfinite(best_scores[i])]
+
+
+def blocked_top_k(queries, vectors, tombstones, top_k, start_row=0, query_block=1024, corpus_block=16384):
+    """
+    Exact top-k for a whole query matrix against a (memory-mapped) corpus.
+
+    The corpus is read block by block and each block is converted to float32
+    once, then multiplied against the queries query_block rows at a time.
+    Only a (query_block x corpus_block) score buffer and the running
+    (num_queries x top_k) results are ever held in memory, never the full
+    query x corpus score matrix. Returns (scores, rows), sorted best first.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    num_queries = len(queries)
+    best_scores = np.full((num_queries, top_k), -np.inf, dtype=np.float32)
+    best_rows = np.full((num_queries, top_k), -1, dtype=np.int64)
+    buffer = np.empty((min(query_block, num_queries), corpus_block), dtype=np.float32)
+
+    for corpus_start in range(start_row, len(vectors), corpus_block):
+        block = np.asarray(vectors[corpus_start:corpus_start + corpus_block], dtype=np.float32)
+        dead = tombstones[corpus_start:corpus_start + len(block)] != 0
+        keep = min(top_k, len(block))
+        for query_start in range(0, num_queries, query_block):
+            query_end = min(query_start + query_block, num_queries)
+            scores = buffer[:query_end - query_start, :len(block)]
+            np.matmul(queries[query_start:query_end], block.T, out=scores)
+            scores[:, dead] = -np.inf
+            # Per-row top-k of this block, then merge with the running top-k
+            block_cols = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            merged_scores = np.concatenate([best_scores[query_start:query_end],
+                                            np.take_along_axis(scores, block_cols, axis=1)], axis=1)
+            merged_rows = np.concatenate([best_rows[query_start:query_end], block_cols + corpus_start], axis=1)
+            winners = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+            best_scores[query_start:query_end] = np.take_along_axis(merged_scores, winners, axis=1)
+            best_rows[query_start:query_end] = np.take_along_axis(merged_rows, winners, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of normalised float16 embeddings.
+
+    Files inside the store directory:
+      meta.json       model name, dimension, number of rows and bytes of text
+      vectors.f16     float16 matrix (rows x dim), read through np.memmap
+      ids.txt         one document id per row
+      texts.bin       UTF-8 document texts, concatenated
+      offsets.u64     start offset of each row's text inside texts.bin
+      tombstones.u8   one byte per row, 1 = deleted
+
+    Rows are never rewritten: deleting a document only sets its tombstone,
+    and re-adding an existing id tombstones the old row and appends a new one.
+    """
+
+    def __init__(self, path, dim, model_name):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != dim or meta["model"] != model_name:
+                raise ValueError(f"Store at '{path}' was built with {meta['model']} ({meta['dim']} dims), not {model_name} ({dim} dims)")
+            self.count = meta["count"]
+            # Stores written before text_bytes was recorded trust the file size
+            self.text_bytes = meta.get("text_bytes")
+            if self.text_bytes is None:
+                self.text_bytes = os.path.getsize(self._file("texts.bin")) if os.path.exists(self._file("texts.bin")) else 0
+        else:
+            self.count = 0
+            self.text_bytes = 0
+        self.dim = dim
+        self.model_name = model_name
+        # Drop any partially written rows left behind by an interrupted append
+        for name, size in (("vectors.f16", self.count * dim * 2), ("offsets.u64", self.count * 8),
+                           ("tombstones.u8", self.count), ("texts.bin", self.text_bytes)):
+            with open(self._file(name), "ab") as f:
+                f.truncate(size)
+        with open(self._file("ids.txt"), "a+", encoding="utf-8") as f:
+            f.seek(0)
+            lines = f.read().splitlines()
+        self.ids = lines[:self.count]
+        if len(lines) != self.count:
+            with open(self._file("ids.txt"), "w", encoding="utf-8") as f:
+                f.writelines(f"{doc_id}\n" for doc_id in self.ids)
+        self.row_of_id = {}
+        tombstones = self.tombstones()
+        for row, doc_id in enumerate(self.ids):
+            if not tombstones[row]:
+                self.row_of_id[doc_id] = row
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _save_meta(self):
+        with open(self._file("meta.json"), "w") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "count": self.count, "text_bytes": self.text_bytes}, f)
+
+    def vectors(self):
+        """Memory-mapped (rows x dim) float16 matrix; pages are only read when touched."""
+        if self.count == 0:
+            return np.zeros((0, self.dim), dtype=np.float16)
+        return np.memmap(self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(self.count, self.dim))
+
+    def tombstones(self):
+        if self.count == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(self._file("tombstones.u8"), dtype=np.uint8, mode="r", shape=(self.count,))
+
+    def live_count(self):
+        return len(self.row_of_id)
+
+    def text(self, row):
+        offsets = np.memmap(self._file("offsets.u64"), dtype=np.uint64, mode="r", shape=(self.count,))
+        start = int(offsets[row])
+        with open(self._file("texts.bin"), "rb") as f:
+            f.seek(start)
+            end = int(offsets[row + 1]) if row + 1 < self.count else self.text_bytes
+            data = f.read(end - start)
+        return data.decode("utf-8")
+
+    def iter_texts(self):
+        """Yield every row's text in row order with one sequential pass over texts.bin."""
+        if self.count == 0:
+            return
+        offsets = np.memmap(self._file("offsets.u64"), dtype=np.uint64, mode="r", shape=(self.count,))
+        with open(self._file("texts.bin"), "rb") as f:
+            for row in range(self.count - 1):
+                yield f.read(int(offsets[row + 1]) - int(offsets[row])).decode("utf-8")
+            yield f.read(self.text_bytes - int(offsets[self.count - 1])).decode("utf-8")
+
+    def append(self, doc_ids, texts, embeddings):
+        """
+        Append one batch of documents; embeddings must already be L2-normalised.
+        If an id appears more than once in the batch, only its last row stays live.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float16)
+        if embeddings.shape != (len(texts), self.dim):
+            raise ValueError(f"Expected embeddings of shape ({len(texts)}, {self.dim}), got {embeddings.shape}")
+        self.delete([doc_id for doc_id in doc_ids if doc_id in self.row_of_id])
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.cumsum([self.text_bytes] + [len(data) for data in encoded[:-1]], dtype=np.uint64)
+        last_row = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        with open(self._file("vectors.f16"), "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self._file("texts.bin"), "ab") as f:
+            f.write(b"".join(encoded))
+        with open(self._file("offsets.u64"), "ab") as f:
+            f.write(offsets.tobytes())
+        with open(self._file("tombstones.u8"), "ab") as f:
+            f.write(bytes(int(last_row[doc_id] != i) for i, doc_id in enumerate(doc_ids)))
+        with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+            f.writelines(f"{doc_id}\n" for doc_id in doc_ids)
+        for doc_id in doc_ids:
+            self.row_of_id[doc_id] = self.count
+            self.ids.append(doc_id)
+            self.count += 1
+        self.text_bytes += sum(len(data) for data in encoded)
+        # meta.json is written last, so a crash mid-append leaves the previous count intact
+        self._save_meta()
+
+    def delete(self, doc_ids):
+        """Tombstone documents by id; returns how many were found."""
+        rows = [self.row_of_id.pop(doc_id) for doc_id in doc_ids if doc_id in self.row_of_id]
+        if rows:
+            tombstones = np.memmap(self._file("tombstones.u8"), dtype=np.uint8, mode="r+", shape=(self.count,))
+            tombstones[rows] = 1
+            tombstones.flush()
+        return len(rows)
+
+    def scan(self, query_embedding, top_k, start_row=0):
+        """
+        Exact cosine scan over rows start_row.. that streams the memory-mapped
+        matrix in blocks, so only one block is resident at a time.
+        Returns the top-k as (scores, rows) arrays.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        if start_row >= self.count:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        scores, rows = blocked_top_k(query, self.vectors(), self.tombstones(), top_k, start_row=start_row)
+        return scores[0], rows[0]
+
+    def search_many(self, query_embeddings, top_k, query_block=1024, corpus_block=16384):
+        """Exact search for a matrix of queries; one list of hits per query."""
+        scores, rows = blocked_top_k(query_embeddings, self.vectors(), self.tombstones(), top_k,
+                                     query_block=query_block, corpus_block=corpus_block)
+        return [top_k_hits(query_scores, query_rows) for query_scores, query_rows in zip(scores, rows)]
+
+    def search(self, query_embedding, top_k):
+        """Exact search; hits use the util.semantic_search format: [{'corpus_id', 'score'}, ...]"""
+        return top_k_hits(*self.scan(query_embedding, top_k))
+
+
+# --- Approximate Nearest-Neighbour Indexes ---
+class ExactIndex:
+    """Brute-force baseline: every query scans the whole store."""
+
+    name = "exact"
+
+    def __init__(self, store):
+        self.store = store
+
+    @classmethod
+    def build(cls, store, **params):
+        return cls(store)
+
+    @classmethod
+    def load(cls, store, **params):
+        return cls(store)
+
+    def save(self):
+        pass
+
+    def describe(self):
+        return f"float16 vectors, {2 * self.store.dim} bytes/vector"
+
+    def search(self, query_embedding, top_k, query_text=None):
+        return self.store.search(query_embedding, top_k)
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a spherical k-means coarse quantizer.
+
+    Every stored row is assigned to its nearest of nlist centroids, and the
+    vectors are copied into list order so that each inverted list is one
+    contiguous slice on disk. A query only scores the nprobe lists whose
+    centroids are closest to it: raising nprobe trades latency for recall.
+    Rows appended after the index was built are scanned exactly, and
+    tombstones are applied at query time, so the index never goes stale.
+    """
+
+    name = "ivf"
+
+    def __init__(self, store, centroids, list_offsets, list_rows, list_vectors, indexed_count, nprobe=8):
+        self.store = store
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.list_vectors = list_vectors
+        self.indexed_count = indexed_count
+        self.nprobe = nprobe
+
+    @staticmethod
+    def directory(store):
+        return os.path.join(store.path, "ivf")
+
+    @staticmethod
+    def assign(vectors, centroids, chunk_rows=65536):
+        """Nearest-centroid id for every row, computed chunk by chunk."""
+        assignment = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_rows):
+            chunk = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+    @classmethod
+    def train_centroids(cls, vectors, nlist, iterations=10, sample_per_list=64, seed=0):
+        """Spherical k-means on a random sample of rows."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), nlist * sample_per_list)
+        sample_rows = np.sort(rng.choice(len(vectors), size=sample_size, replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls.assign(sample, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+            # Sum each cluster's members with one reduceat over the rows sorted by cluster
+            order = np.argsort(assignment, kind="stable")
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], np.cumsum(counts)[filled] - counts[filled], axis=0)
+            # Re-seed empty lists from random sample points
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        return centroids
+
+    @classmethod
+    def build(cls, store, nlist=None, nprobe=8, **params):
+        vectors = store.vectors()
+        if store.count == 0:
+            raise ValueError("Cannot build an IVF index over an empty store")
+        if nlist is None:
+            # Common rule of thumb: about 4 * sqrt(N) lists
+            nlist = max(1, int(4 * np.sqrt(store.count)))
+        nlist = min(nlist, store.count)
+        centroids = cls.train_centroids(vectors, nlist)
+        assignment = cls.assign(vectors, centroids)
+        list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+
+        directory = cls.directory(store)
+        os.makedirs(directory, exist_ok=True)
+        list_vectors = np.lib.format.open_memmap(os.path.join(directory, "vectors.npy"), mode="w+",
+                                                 dtype=np.float16, shape=(store.count, store.dim))
+        for start in range(0, store.count, 65536):
+            rows = list_rows[start:start + 65536]
+            list_vectors[start:start + len(rows)] = vectors[rows]
+        list_vectors.flush()
+        return cls(store, centroids.astype(np.float32), list_offsets, list_rows, list_vectors, store.count, nprobe)
+
+    def save(self):
+        directory = self.directory(self.store)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "list_offsets.npy"), self.list_offsets)
+        np.save(os.path.join(directory, "list_rows.npy"), self.list_rows)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"indexed_count": self.indexed_count, "nlist": len(self.centroids)}, f)
+
+    @classmethod
+    def load(cls, store, nprobe=8, **params):
+        directory = cls.directory(store)
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(
+            store,
+            np.load(os.path.join(directory, "centroids.npy")),
+            np.load(os.path.join(directory, "list_offsets.npy")),
+            np.load(os.path.join(directory, "list_rows.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+            meta["indexed_count"],
+            nprobe,
+        )
+
+    def describe(self):
+        return f"nlist={len(self.centroids)}, nprobe={self.nprobe}"
+
+    def search(self, query_embedding, top_k, query_text=None):
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        tombstones = self.store.tombstones()
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for list_id in probe:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            rows = np.asarray(self.list_rows[start:end])
+            scores = np.asarray(self.list_vectors[start:end], dtype=np.float32) @ query
+            scores[tombstones[rows] != 0] = -np.inf
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, scores, rows, top_k)
+
+        # Rows appended since the build are not in any list yet: scan them exactly
+        if self.indexed_count < self.store.count:
+            tail_scores, tail_rows = self.store.scan(query, top_k, start_row=self.indexed_count)
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, tail_scores, tail_rows, top_k)
+        return top_k_hits(best_scores, best_rows)
+
+
+# --- Quantized Indexes ---
+# Number of set bits in every possible byte, for popcount over packed binary codes
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class QuantizedIndex:
+    """
+    Compact codes for every stored row plus a float rescoring pass.
+
+    The codes are scanned to pick rescore * top_k candidates, then only those
+    candidates are re-scored with the float16 vectors from the store, which
+    recovers most of the accuracy lost to quantization. Subclasses define how
+    vectors are encoded and how the codes are scored against a query.
+    """
+
+    name = None
+    default_rescore = 4
+
+    def __init__(self, store, codes, params, indexed_count, rescore=None):
+        self.store = store
+        self.codes = codes
+        self.params = params
+        self.indexed_count = indexed_count
+        self.rescore = rescore or self.default_rescore
+
+    @classmethod
+    def directory(cls, store):
+        return os.path.join(store.path, cls.name)
+
+    @classmethod
+    def build(cls, store, rescore=None, **params):
+        if store.count == 0:
+            raise ValueError(f"Cannot build a {cls.name} index over an empty store")
+        vectors = store.vectors()
+        quantizer_params = cls.fit(vectors)
+        directory = cls.directory(store)
+        os.makedirs(directory, exist_ok=True)
+        code_shape = (store.count, cls.code_width(store.dim))
+        codes = np.lib.format.open_memmap(os.path.join(directory, "codes.npy"), mode="w+", dtype=cls.code_dtype, shape=code_shape)
+        for start in range(0, store.count, 65536):
+            chunk = np.asarray(vectors[start:start + 65536], dtype=np.float32)
+            codes[start:start + len(chunk)] = cls.encode(chunk, quantizer_params)
+        codes.flush()
+        return cls(store, codes, quantizer_params, store.count, rescore)
+
+    def save(self):
+        directory = self.directory(self.store)
+        np.savez(os.path.join(directory, "params.npz"), **self.params)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"indexed_count": self.indexed_count}, f)
+
+    @classmethod
+    def load(cls, store, rescore=None, **params):
+        directory = cls.directory(store)
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        with np.load(os.path.join(directory, "params.npz")) as saved:
+            quantizer_params = {key: saved[key] for key in saved.files}
+        codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        return cls(store, codes, quantizer_params, meta["indexed_count"], rescore)
+
+    def describe(self):
+        return f"{self.codes.shape[1] * self.codes.itemsize} bytes/vector, rescore={self.rescore}x"
+
+    def search(self, query_embedding, top_k, query_text=None, chunk_rows=65536):
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        tombstones = self.store.tombstones()
+        prepared = self.prepare_query(query)
+        num_candidates = top_k * self.rescore
+
+        # Pass 1: approximate scores from the codes only
+        candidate_scores = np.zeros(0, dtype=np.float32)
+        candidate_rows = np.zeros(0, dtype=np.int64)
+        for start in range(0, self.indexed_count, chunk_rows):
+            scores = self.score_codes(np.asarray(self.codes[start:start + chunk_rows]), prepared)
+            scores[tombstones[start:start + len(scores)] != 0] = -np.inf
+            rows = np.arange(start, start + len(scores))
+            candidate_scores, candidate_rows = merge_top_k(candidate_scores, candidate_rows, scores, rows, num_candidates)
+        candidate_rows = np.sort(candidate_rows[np.isfinite(candidate_scores)])
+
+        # Pass 2: exact float scores for the candidates only
+        exact_scores = np.asarray(self.store.vectors()[candidate_rows], dtype=np.float32) @ query
+        best_scores, best_rows = merge_top_k(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64),
+                                             exact_scores, candidate_rows, top_k)
+
+        # Rows appended since the build have no codes yet: scan them exactly
+        if self.indexed_count < self.store.count:
+            tail_scores, tail_rows = self.store.scan(query, top_k, start_row=self.indexed_count)
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, tail_scores, tail_rows, top_k)
+        return top_k_hits(best_scores, best_rows)
+
+
+class Int8Index(QuantizedIndex):
+    """Scalar quantization: each dimension mapped linearly onto 256 levels (1 byte/dim)."""
+
+    name = "int8"
+    code_dtype = np.int8
+    default_rescore = 4
+
+    @staticmethod
+    def code_width(dim):
+        return dim
+
+    @staticmethod
+    def fit(vectors, sample_size=100000, seed=0):
+        """Per-dimension value range, taken from a sample of the stored vectors."""
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(len(vectors), size=min(len(vectors), sample_size), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        low = sample.min(axis=0)
+        scale = np.maximum(sample.max(axis=0) - low, 1e-6) / 255.0
+        return {"low": low, "scale": scale}
+
+    @staticmethod
+    def encode(vectors, params):
+        levels = np.rint((vectors - params["low"]) / params["scale"])
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    @staticmethod
+    def prepare_query(query, params=None):
+        return query
+
+    def score_codes(self, codes, query):
+        # x ~= low + scale * (code + 128), so q.x ~= q.low + (q * scale).(code + 128)
+        weights = query * self.params["scale"]
+        offset = float(query @ self.params["low"] + 128.0 * weights.sum())
+        return codes.astype(np.float32) @ weights + offset
+
+
+class BinaryIndex(QuantizedIndex):
+    """Sign quantization: 1 bit per dimension, scored by Hamming distance with a popcount table."""
+
+    name = "binary"
+    code_dtype = np.uint8
+    default_rescore = 10
+
+    @staticmethod
+    def code_width(dim):
+        return (dim + 7) // 8
+
+    @staticmethod
+    def fit(vectors):
+        return {}
+
+    @staticmethod
+    def encode(vectors, params):
+        return np.packbits(vectors > 0, axis=1)
+
+    def prepare_query(self, query):
+        return np.packbits(query > 0)
+
+    def score_codes(self, codes, query_code):
+        # Fewer differing bits = more similar, so negate the Hamming distance
+        hamming = POPCOUNT_TABLE[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+        return -hamming.astype(np.float32)
+
+
+# --- Hybrid Lexical + Dense Retrieval ---
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class HybridIndex:
+    """
+    BM25 inverted index used as a cheap candidate generator for dense reranking.
+
+    Postings are kept in CSR form: for term t, rows[offsets[t]:offsets[t+1]]
+    are the documents containing it and tfs[...] the term frequencies. A query
+    scores only the postings of its own terms, keeps the best shortlist rows
+    by BM25, and computes dense cosine scores for that shortlist alone.
+    Queries with no term in the vocabulary fall back to exact dense search.
+    """
+
+    name = "hybrid"
+    needs_text = True
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, store, vocab, offsets, rows, tfs, doc_lengths, indexed_count, shortlist=100):
+        self.store = store
+        self.vocab = vocab
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.indexed_count = indexed_count
+        self.shortlist = shortlist
+        self.average_length = max(float(doc_lengths.mean()), 1.0) if len(doc_lengths) else 1.0
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((indexed_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    @staticmethod
+    def directory(store):
+        return os.path.join(store.path, "bm25")
+
+    @classmethod
+    def build(cls, store, shortlist=100, **params):
+        vocab = {}
+        term_ids = []
+        rows = []
+        tfs = []
+        doc_lengths = np.zeros(store.count, dtype=np.uint32)
+        for row, text in enumerate(store.iter_texts()):
+            terms = tokenize(text)
+            doc_lengths[row] = len(terms)
+            for term, tf in collections.Counter(terms).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                tfs.append(min(tf, 65535))
+        term_ids = np.array(term_ids, dtype=np.int64)
+        # Stable sort keeps each posting list in row order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocab)))]).astype(np.int64)
+        os.makedirs(cls.directory(store), exist_ok=True)
+        return cls(store, vocab, offsets, np.array(rows, dtype=np.int64)[order],
+                   np.array(tfs, dtype=np.uint16)[order], doc_lengths, store.count, shortlist)
+
+    def save(self):
+        directory = self.directory(self.store)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        np.save(os.path.join(directory, "rows.npy"), self.rows)
+        np.save(os.path.join(directory, "tfs.npy"), self.tfs)
+        np.save(os.path.join(directory, "doc_lengths.npy"), self.doc_lengths)
+        with open(os.path.join(directory, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"indexed_count": self.indexed_count, "terms": len(self.vocab)}, f)
+
+    @classmethod
+    def load(cls, store, shortlist=100, **params):
+        directory = cls.directory(store)
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(
+            store,
+            vocab,
+            np.load(os.path.join(directory, "offsets.npy")),
+            np.load(os.path.join(directory, "rows.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "tfs.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "doc_lengths.npy")),
+            meta["indexed_count"],
+            shortlist,
+        )
+
+    def describe(self):
+        return f"BM25 k1={self.k1}, b={self.b}, {len(self.vocab)} terms, shortlist={self.shortlist}"
+
+    def bm25_candidates(self, query_text):
+        """Rows with the highest BM25 score for the query (at most shortlist of them)."""
+        term_ids = {self.vocab[term] for term in tokenize(query_text) if term in self.vocab}
+        if not term_ids:
+            return np.zeros(0, dtype=np.int64)
+        all_rows = []
+        all_scores = []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = np.asarray(self.rows[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            length_norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[rows] / self.average_length)
+            all_rows.append(rows)
+            all_scores.append(self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + length_norm))
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)).astype(np.float32)
+        scores[self.store.tombstones()[rows] != 0] = -np.inf
+        if len(scores) > self.shortlist:
+            keep = np.argpartition(-scores, self.shortlist - 1)[:self.shortlist]
+            rows, scores = rows[keep], scores[keep]
+        return np.sort(rows[np.isfinite(scores)])
+
+    def search(self, query_embedding, top_k, query_text=None):
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        candidates = self.bm25_candidates(query_text) if query_text else np.zeros(0, dtype=np.int64)
+        if len(candidates) == 0:
+            return self.store.search(query, top_k)
+
+        # Dense cosine scores for the lexical shortlist only
+        dense_scores = np.asarray(self.store.vectors()[candidates], dtype=np.float32) @ query
+        best_scores, best_rows = merge_top_k(np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64),
+                                             dense_scores, candidates, top_k)
+
+        # Rows appended since the build are not in the inverted index yet: scan them exactly
+        if self.indexed_count < self.store.count:
+            tail_scores, tail_rows = self.store.scan(query, top_k, start_row=self.indexed_count)
+            best_scores, best_rows = merge_top_k(best_scores, best_rows, tail_scores, tail_rows, top_k)
+        return top_k_hits(best_scores, best_rows)
+
+
+# Index backends selectable with --index; new backends only need build/load/save/describe/search
+ANN_INDEXES = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+    Int8Index.name: Int8Index,
+    BinaryIndex.name: BinaryIndex,
+    HybridIndex.name: HybridIndex,
+}
+
+
+def open_index(store, args):
+    """Load the requested index from the store directory, building it first if asked or missing."""
+    index_class = ANN_INDEXES[args.index]
+    if index_class is ExactIndex:
+        return ExactIndex(store)
+    params = {"nlist": args.nlist, "nprobe": args.nprobe, "rescore": args.rescore, "shortlist": args.shortlist}
+    if args.build_index or not os.path.exists(os.path.join(index_class.directory(store), "meta.json")):
+        print(f"Building {args.index} index over {store.count} rows...")
+        start = time.perf_counter()
+        index = index_class.build(store, **params)
+        index.save()
+        print(f"Index built in {time.perf_counter() - start:.2f} s ({index.describe()}).")
+        return index
+    return index_class.load(store, **params)
+
+
+def benchmark_index(store, index, model, num_queries, top_k, seed=0):
+    """Compare an index against the exact path: recall@k and mean latency per query."""
+    live_rows = np.flatnonzero(store.tombstones() == 0)
+    rng = np.random.default_rng(seed)
+    query_rows = np.sort(rng.choice(live_rows, size=min(num_queries, len(live_rows)), replace=False))
+    if getattr(index, "needs_text", False):
+        # Text indexes need real query strings: use the first few words of sampled documents
+        query_texts = [" ".join(store.text(row).split()[:8]) for row in query_rows]
+        queries = model.encode(query_texts, normalize_embeddings=True, convert_to_numpy=True)
+    else:
+        # Stored vectors plus a little noise stand in for unseen queries near the data
+        query_texts = [None] * len(query_rows)
+        queries = np.asarray(store.vectors()[query_rows], dtype=np.float32)
+        queries += rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact_time = index_time = 0.0
+    found = 0
+    for query, query_text in zip(queries, query_texts):
+        start = time.perf_counter()
+        exact_hits = store.search(query, top_k)
+        exact_time += time.perf_counter() - start
+        start = time.perf_counter()
+        index_hits = index.search(query, top_k, query_text=query_text)
+        index_time += time.perf_counter() - start
+        found += len({hit["corpus_id"] for hit in exact_hits} & {hit["corpus_id"] for hit in index_hits})
+    expected = min(top_k, len(live_rows)) * len(queries)
+
+    print(f"\n--- {index.name} vs exact: {len(queries)} queries, top_k={top_k} ---")
+    print(index.describe())
+    print(f"Recall@{top_k}:          {found / expected:.4f}")
+    print(f"Exact latency:      {1000 * exact_time / len(queries):.2f} ms/query")
+    print(f"{index.name + ' latency:':<20}{1000 * index_time / len(queries):.2f} ms/query")
+    print(f"Speed-up:           {exact_time / index_time if index_time > 0 else float('inf'):.1f}x")
+    print("-------------------------------------------------")
+
+
+def read_documents(path, first_row):
+    """Yield (id, text) pairs from a JSONL file with 'id'/'text' fields or a plain text file."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            if path.endswith((".jsonl", ".ndjson")):
+                record = json.loads(line)
+                yield str(record["id"]), record["text"]
+            else:
+                yield str(first_row + line_number), line.rstrip("\n")
+
+
+def batched(items, size):
+    """Group an iterator into lists of at most size items without reading ahead further."""
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def add_documents(store, model, documents, batch_size):
+    """Encode (id, text) pairs in batches and append them to the store."""
+    added = 0
+    for batch in batched(documents, batch_size):
+        added += encode_and_append(store, model, batch)
+    return added
+
+
+def encode_and_append(store, model, batch):
+    doc_ids = [doc_id for doc_id, _ in batch]
+    texts = [text for _, text in batch]
+    embeddings = model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+    store.append(doc_ids, texts, embeddings)
+    return len(batch)
+
+
+# --- Sharded Multi-process Encoding ---
+# Set in each worker process by init_encode_worker
+worker_model = None
+
+
+def init_encode_worker(name, threads, ready):
+    """Pool initializer: every worker loads its own CPU copy of the model once and pins its thread count."""
+    global worker_model
+    torch.set_num_threads(threads)
+    worker_model = SentenceTransformer(name, device="cpu")
+    ready.release()
+
+
+def encode_shard(texts, batch_size):
+    embeddings = worker_model.encode(texts, batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True)
+    return embeddings.astype(np.float16)
+
+
+def default_threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def open_encode_pool(workers, threads):
+    """
+    Start the worker pool and wait until every worker has loaded the model,
+    so timings measure encoding only. The script has no __main__ guard, so
+    workers are forked rather than spawned (spawning would re-run the script).
+    """
+    context = multiprocessing.get_context("fork")
+    ready = context.Semaphore(0)
+    pool = context.Pool(workers, initializer=init_encode_worker, initargs=(model_name, threads, ready))
+    for _ in range(workers):
+        ready.acquire()
+    return pool
+
+
+def encode_sharded(pool, documents, workers, shard_size, batch_size):
+    """
+    Yield (shard, embeddings) pairs in input order.
+    At most two shards per worker are in flight, so the input is streamed
+    rather than read into memory up front.
+    """
+    pending = collections.deque()
+    for shard in batched(documents, shard_size):
+        pending.append((shard, pool.apply_async(encode_shard, ([text for _, text in shard], batch_size))))
+        if len(pending) >= 2 * workers:
+            shard, result = pending.popleft()
+            yield shard, result.get()
+    while pending:
+        shard, result = pending.popleft()
+        yield shard, result.get()
+
+
+def add_documents_sharded(store, documents, args):
+    """Encode documents across --workers processes and append them to the store in input order."""
+    threads = args.threads_per_worker or default_threads_per_worker(args.workers)
+    print(f"Encoding with {args.workers} worker processes x {threads} torch threads...")
+    added = 0
+    start = time.perf_counter()
+    pool = open_encode_pool(args.workers, threads)
+    try:
+        for shard, embeddings in encode_sharded(pool, documents, args.workers, args.shard_size, args.encode_batch_size):
+            store.append([doc_id for doc_id, _ in shard], [text for _, text in shard], embeddings)
+            added += len(shard)
+    finally:
+        pool.terminate()
+    elapsed = time.perf_counter() - start
+    print(f"Encoded {added} documents in {elapsed:.2f} s ({added / elapsed if elapsed > 0 else 0.0:.1f} docs/sec).")
+    return added
+
+
+def run_scaling_report(args):
+    """Time sharded encoding of a sample of --add with 1, 2, 4, ... --workers processes."""
+    sample = list(itertools.islice(read_documents(args.add, 0), args.scaling_sample))
+    worker_counts = sorted({1, args.workers} | {2 ** i for i in range(args.workers.bit_length()) if 2 ** i < args.workers})
+    print(f"\nScaling report: {len(sample)} documents from '{args.add}', {os.cpu_count()} CPU cores")
+    print(f"{'Workers':>8} {'Threads':>8} {'Seconds':>9} {'Docs/sec':>10} {'Speed-up':>9} {'Efficiency':>11}")
+    baseline = None
+    for workers in worker_counts:
+        threads = args.threads_per_worker or default_threads_per_worker(workers)
+        pool = open_encode_pool(workers, threads)
+        try:
+            start = time.perf_counter()
+            for _ in encode_sharded(pool, sample, workers, args.shard_size, args.encode_batch_size):
+                pass
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.terminate()
+        rate = len(sample) / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>8} {threads:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / baseline:>8.2f}x {rate / baseline / workers:>10.0%}")
+    print("-------------------------------------------------")
+
+
+def run_query_file(store, index, model, args):
+    """Answer every line of --queries-file and write one JSON line of hits per query to --output."""
+    with open(args.queries_file, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    print(f"\nEncoding {len(queries)} queries from '{args.queries_file}'...")
+    start = time.perf_counter()
+    query_embeddings = model.encode(queries, batch_size=args.encode_batch_size, normalize_embeddings=True, convert_to_numpy=True)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if isinstance(index, ExactIndex):
+        all_hits = store.search_many(query_embeddings, args.top_k, args.query_block, args.corpus_block)
+    else:
+        all_hits = [index.search(query_embedding, args.top_k, query_text=query)
+                    for query, query_embedding in zip(queries, query_embeddings)]
+    search_time = time.perf_counter() - start
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        for query, hits in zip(queries, all_hits):
+            results = [{"id": store.ids[hit["corpus_id"]], "score": round(hit["score"], 6)} for hit in hits]
+            f.write(json.dumps({"query": query, "hits": results}, ensure_ascii=False) + "\n")
+
+    print(f"\n--- Batch Search Summary ({index.name}) ---")
+    print(f"Queries:            {len(queries)}")
+    print(f"Corpus rows:        {store.count}")
+    print(f"Encoding time:      {encode_time:.2f} s")
+    print(f"Search time:        {search_time:.2f} s ({len(queries) / search_time if search_time > 0 else 0.0:.1f} queries/sec)")
+    if isinstance(index, ExactIndex) and search_time > 0:
+        # 2 * d FLOPs per query/document dot product
+        flops = 2.0 * len(queries) * store.count * store.dim
+        print(f"Score throughput:   {flops / search_time / 1e9:.1f} GFLOP/s")
+    print(f"Results written to: {args.output}")
+    print("-------------------------------------------------")
+
+
+def run_store_mode(model, args, default_corpus, default_query):
+    """Open (or create) the on-disk store, apply adds/deletes, then answer the query from disk."""
+    store = EmbeddingStore(args.store, model.get_sentence_embedding_dimension(), model_name)
+    print(f"\nOpened embedding store '{args.store}' ({store.live_count()} live documents, {store.count} rows)")
+
+    if args.scaling_report:
+        run_scaling_report(args)
+        return
+    if args.add and args.workers > 1:
+        added = add_documents_sharded(store, read_documents(args.add, store.count), args)
+        print(f"Appended {added} documents from '{args.add}'.")
+    elif args.add:
+        added = add_documents(store, model, read_documents(args.add, store.count), args.encode_batch_size)
+        print(f"Appended {added} documents from '{args.add}'.")
+    elif store.count == 0:
+        added = add_documents(store, model, ((str(i), s) for i, s in enumerate(default_corpus)), args.encode_batch_size)
+        print(f"Store was empty: appended the {added} example corpus sentences.")
+    if args.delete:
+        print(f"Tombstoned {store.delete(args.delete)} of {len(args.delete)} requested ids.")
+
+    index = open_index(store, args)
+    if args.benchmark:
+        benchmark_index(store, index, model, args.benchmark, args.top_k)
+    if args.queries_file:
+        run_query_file(store, index, model, args)
+        return
+
+    query = args.query or default_query
+    # Only the query is encoded; the corpus embeddings are read back from disk
+    query_embedding = model.encode(query, normalize_embeddings=True, convert_to_numpy=True)
+    hits = index.search(query_embedding, args.top_k, query_text=query)
+
+    print(f"\n--- Top {args.top_k} Most Similar Documents to the Query ---")
+    print(f"Query: \"{query}\"\n")
+    if not hits:
+        print("No similar documents found.")
+    for rank, hit in enumerate(hits):
+        print(f"Rank {rank+1}: Score: {hit['score']:.4f}")
+        print(f"   Id: {store.ids[hit['corpus_id']]}")
+        print(f"   Sentence: \"{store.text(hit['corpus_id'])}\"")
+        print("-" * 15)
+    print("-------------------------------------------------")
+# ----------------------------------
+
 # 1. Determine device (GPU or CPU)
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 print(f"Using device: {device}")
@@ -16,9 +996,10 @@ if device == 'cuda':
     print(f"GPU: {torch.cuda.get_device_name(0)}")
 
 # 2. Load the Sentence Transformer model
+model_name = 'sentence-transformers/all-MiniLM-L6-v2'
 print("Loading Sentence Transformer model (may download on first run)...")
 try:
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=device)
+    model = SentenceTransformer(model_name, device=device)
     print("Model loaded successfully.")
 
 except Exception as e:
@@ -42,6 +1023,14 @@ corpus_sentences = [
 #    Note it uses different words than the target sentences in the corpus.
 query_sentence = "How is the road congestion in the city right now?"
 
+if args.store:
+    try:
+        run_store_mode(model, args, corpus_sentences, query_sentence)
+    except Exception as e:
+        print(f"Error in embedding store mode: {e}")
+    print("\nExample finished.")
+    exit()
+
 print("\nCorpus Sentences:")
 for i, s in enumerate(corpus_sentences):
     print(f"- \"{s}\"")
@@ -1,12 +1,504 @@
 # Import the pipeline function and torch
-from transformers import pipeline
+from transformers import pipeline, AutoModelForCausalLM
 import torch
+import argparse
+import json
+import os
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
 print("Task: Text Generation")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the original pipeline example below.
+parser = argparse.ArgumentParser(description="Local GPT-2 text generation example.")
+parser.add_argument("--prompt", help="Prompt to continue (default: the example prompt below).")
+parser.add_argument("--stream", action="store_true", help="Print tokens as they are generated and report time-to-first-token and inter-token latency.")
+parser.add_argument("--temperature", type=float, help="Sample with this temperature in --stream and --prompts-file modes (default: greedy).")
+parser.add_argument("--top-k", type=int, default=50, help="Top-k cut-off when sampling (default: 50).")
+parser.add_argument("--prompts-file", help="Generate a completion for every prompt in this file (one per line, or .jsonl with a 'prompt' field).")
+parser.add_argument("--output", help="JSONL file for --prompts-file results, written in input order (default: print them).")
+parser.add_argument("--batch-size", type=int, default=16, help="Prompts decoded together in --prompts-file mode (default: 16).")
+parser.add_argument("--max-new-tokens", type=int, default=50, help="New tokens per prompt in --prompts-file mode (default: 50).")
+parser.add_argument("--prefix", default="", help="Text put in front of every prompt from --prompts-file, e.g. a shared instruction.")
+parser.add_argument("--prefix-cache", action="store_true", help="Run --prompts-file one prompt at a time, reusing the KV cache of shared prompt prefixes, and compare with no cache.")
+parser.add_argument("--prefix-cache-mb", type=float, default=256, help="Memory cap for cached prefixes in MB (default: 256).")
+parser.add_argument("--speculative", action="store_true", help="Compare plain greedy decoding with speculative decoding using a draft model.")
+parser.add_argument("--draft-model", default="distilgpt2", help="Small model that proposes tokens for --speculative (default: distilgpt2).")
+parser.add_argument("--num-draft-tokens", type=int, default=4, help="Tokens proposed by the draft model per verification pass (default: 4).")
+args = parser.parse_args()
+# ----------------------------
+
+# --- Token Streaming ---
+class TokenStream:
+    """
+    Iterator over the text of a generation, one decoded token at a time.
+
+    The prompt is prefilled once and every following token costs one forward
+    pass against the KV cache, so text is yielded as soon as each token is
+    chosen. Tokens that end in the middle of a multi-byte character are held
+    back until the character is complete. When iteration finishes, metrics
+    holds time-to-first-token, inter-token latencies and tokens/sec.
+    """
+
+    def __init__(self, model, tokenizer, prompt, max_new_tokens, temperature=None, top_k=50, prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.prefix_cache = prefix_cache
+        self.metrics = None
+
+    def next_token(self, logits):
+        if not self.temperature:
+            return int(logits.argmax())
+        top_logits, top_ids = torch.topk(logits / self.temperature, min(self.top_k, logits.shape[-1]))
+        return int(top_ids[torch.multinomial(torch.softmax(top_logits, dim=-1), 1)])
+
+    @torch.no_grad()
+    def __iter__(self):
+        start = time.perf_counter()
+        token_times = []
+        prompt_ids = input_ids = self.tokenizer.encode(self.prompt)
+        past_key_values = None
+        cached_tokens = 0
+        if self.prefix_cache is not None:
+            cached_tokens, past_key_values = self.prefix_cache.lookup(prompt_ids)
+            input_ids = prompt_ids[cached_tokens:]
+        reply_ids = []
+        emitted = ""
+        for _ in range(self.max_new_tokens):
+            outputs = self.model(input_ids=torch.tensor([input_ids], device=self.model.device),
+                                 past_key_values=past_key_values, use_cache=True)
+            past_key_values = outputs.past_key_values
+            if hasattr(past_key_values, "to_legacy_cache"):
+                past_key_values = past_key_values.to_legacy_cache()
+            if self.prefix_cache is not None and not token_times:
+                self.prefix_cache.store(prompt_ids, past_key_values)
+            next_id = self.next_token(outputs.logits[0, -1])
+            token_times.append(time.perf_counter())
+            if next_id == self.tokenizer.eos_token_id:
+                break
+            reply_ids.append(next_id)
+            input_ids = [next_id]
+            text = self.tokenizer.decode(reply_ids, skip_special_tokens=True)
+            if not text.endswith("\ufffd"):
+                yield text[len(emitted):]
+                emitted = text
+        total = time.perf_counter() - start
+        gaps = [later - earlier for earlier, later in zip(token_times, token_times[1:])]
+        self.metrics = {
+            "tokens": len(reply_ids),
+            "prompt_tokens": len(prompt_ids),
+            "cached_prompt_tokens": cached_tokens,
+            "time_to_first_token": token_times[0] - start if token_times else 0.0,
+            "inter_token_latencies": gaps,
+            "total_time": total,
+            "tokens_per_sec": len(reply_ids) / total if total > 0 else 0.0,
+        }
+
+
+def print_stream_metrics(metrics):
+    gaps = sorted(metrics["inter_token_latencies"])
+    print("\n--- Streaming Metrics ---")
+    print(f"Tokens generated:       {metrics['tokens']}")
+    print(f"Time to first token:    {1000 * metrics['time_to_first_token']:.1f} ms")
+    if gaps:
+        print(f"Inter-token latency:    mean {1000 * sum(gaps) / len(gaps):.1f} ms, "
+              f"p50 {1000 * gaps[len(gaps) // 2]:.1f} ms, max {1000 * gaps[-1]:.1f} ms")
+    print(f"Total time:             {metrics['total_time']:.2f} s ({metrics['tokens_per_sec']:.1f} tokens/sec)")
+    print("-------------------------")
+# -----------------------
+
+# --- Batched Prompt File Generation ---
+def read_prompts(path):
+    """Read prompts from a .jsonl file with a 'prompt' field, or from a text file with one prompt per line."""
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson"):
+                prompts.append(str(json.loads(line)["prompt"]))
+            else:
+                prompts.append(line.rstrip("\n"))
+    return prompts
+
+
+def choose_next_tokens(logits, temperature=None, top_k=50):
+    """Greedy choice for each row of logits, or top-k sampling when a temperature is given."""
+    if not temperature:
+        return logits.argmax(dim=-1)
+    top_logits, top_ids = torch.topk(logits / temperature, min(top_k, logits.shape[-1]), dim=-1)
+    picks = torch.multinomial(torch.softmax(top_logits, dim=-1), 1)
+    return top_ids.gather(-1, picks).squeeze(-1)
+
+
+@torch.no_grad()
+def generate_batch(model, batch_ids, max_new_tokens, eos_token_id, temperature=None, top_k=50):
+    """
+    Decode a batch of tokenized prompts together.
+
+    Prompts are left-padded so every row's last token sits in the final
+    column, with an attention mask hiding the padding and position ids that
+    start at 0 for each row's first real token. A row that produces EOS is
+    dropped from the batch (and from the KV cache) straight away, so later
+    steps only run the rows still generating. Returns one list of new token
+    ids per prompt and the number of row-steps actually computed.
+    """
+    device = model.device
+    longest = max(len(ids) for ids in batch_ids)
+    input_ids = torch.tensor([[eos_token_id] * (longest - len(ids)) + ids for ids in batch_ids], device=device)
+    attention_mask = torch.tensor([[0] * (longest - len(ids)) + [1] * len(ids) for ids in batch_ids], device=device)
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+    rows = torch.arange(len(batch_ids), device=device)  # batch row -> prompt index
+    outputs_ids = [[] for _ in batch_ids]
+    past_key_values = None
+    row_steps = 0
+
+    for _ in range(max_new_tokens):
+        outputs = model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                        past_key_values=past_key_values, use_cache=True)
+        row_steps += len(rows)
+        next_ids = choose_next_tokens(outputs.logits[:, -1], temperature, top_k)
+        finished = next_ids == eos_token_id
+        for row, token in zip(rows.tolist(), next_ids.tolist()):
+            if token != eos_token_id:
+                outputs_ids[row].append(token)
+        if finished.all():
+            break
+
+        # Keep only the unfinished rows for the next step
+        keep = ~finished
+        past_key_values = tuple((k[keep], v[keep]) for k, v in outputs.past_key_values)
+        rows = rows[keep]
+        input_ids = next_ids[keep].unsqueeze(-1)
+        position_ids = position_ids[keep][:, -1:] + 1
+        attention_mask = torch.cat([attention_mask[keep], attention_mask.new_ones((len(rows), 1))], dim=-1)
+    return outputs_ids, row_steps
+
+
+def run_prompts_file(generator, args):
+    """Generate completions for a prompt file in length-sorted batches and write them out in input order."""
+    tokenizer = generator.tokenizer
+    model = generator.model.eval()
+    prompts = [args.prefix + prompt for prompt in read_prompts(args.prompts_file)]
+    if not prompts:
+        print("No prompts found.")
+        return
+    encoded = [tokenizer.encode(prompt) or [tokenizer.eos_token_id] for prompt in prompts]
+    # Sort by token length so each batch holds prompts of similar length and needs little padding
+    order = sorted(range(len(prompts)), key=lambda i: len(encoded[i]))
+    completions = [None] * len(prompts)
+    print(f"\nGenerating up to {args.max_new_tokens} tokens for {len(prompts)} prompts, batch size {args.batch_size}...")
+
+    start = time.perf_counter()
+    new_tokens = row_steps = padding = 0
+    for batch_start in range(0, len(order), args.batch_size):
+        batch = order[batch_start:batch_start + args.batch_size]
+        batch_ids = [encoded[i] for i in batch]
+        longest = max(len(ids) for ids in batch_ids)
+        padding += sum(longest - len(ids) for ids in batch_ids)
+        outputs_ids, steps = generate_batch(model, batch_ids, args.max_new_tokens, tokenizer.eos_token_id,
+                                            args.temperature, args.top_k)
+        row_steps += steps
+        for i, ids in zip(batch, outputs_ids):
+            completions[i] = tokenizer.decode(ids, skip_special_tokens=True)
+            new_tokens += len(ids)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for prompt, completion in zip(prompts, completions):
+                f.write(json.dumps({"prompt": prompt, "completion": completion}, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(completions)} completions to {args.output}")
+    else:
+        print("\n--- Generated Text ---")
+        for i, (prompt, completion) in enumerate(zip(prompts, completions)):
+            print(f"Result {i+1}:")
+            print(prompt + completion)
+            print("-" * 20)
+
+    print("\n--- Batch Generation Report ---")
+    print(f"Prompts:             {len(prompts)} in {-(-len(prompts) // args.batch_size)} batches of up to {args.batch_size}")
+    print(f"New tokens:          {new_tokens} in {elapsed:.2f} s ({new_tokens / elapsed:.1f} tokens/sec)")
+    print(f"Padding tokens:      {padding} ({padding / (padding + sum(map(len, encoded))):.1%} of prompt positions)")
+    print(f"Decode row-steps:    {row_steps} (finished rows are dropped; {len(prompts) * args.max_new_tokens} without early stopping)")
+    print("-------------------------------")
+# --------------------------------------
+
+# --- Shared-Prefix KV Cache ---
+def cache_bytes(past_key_values):
+    return sum(t.nelement() * t.element_size() for layer in past_key_values for t in layer)
+
+
+class PrefixNode:
+    """One edge of the prefix trie: a run of tokens and the KV entries for just those positions."""
+
+    def __init__(self, tokens, past_key_values, parent):
+        self.tokens = tokens
+        self.past_key_values = past_key_values
+        self.parent = parent
+        self.children = {}  # first token of the child's run -> PrefixNode
+        self.last_used = 0
+
+
+class PrefixCache:
+    """
+    LRU cache of prompt KV caches, kept as a token trie.
+
+    Each node holds the cache entries for its own run of tokens only, so a
+    prefix shared by many stored prompts is held once and each prompt only
+    adds the positions after the point where it branches off. lookup() walks
+    the trie along a new prompt's ids and joins the cache of the longest
+    stored prefix, so only the rest of the prompt has to be run through the
+    model. At least one token is always left uncached because its logits
+    start the generation. Once the total size goes over max_bytes, the least
+    recently used leaves are evicted first; shared prefixes go only after
+    every branch below them.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.root = PrefixNode((), None, None)
+        self.leaves = set()
+        self.bytes = 0
+        self.clock = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _walk(self, ids):
+        """Follow ids down the trie; returns the matched path as (node, tokens matched in it) and its length."""
+        path, node, depth = [], self.root, 0
+        while depth < len(ids) and ids[depth] in node.children:
+            node = node.children[ids[depth]]
+            matched = 0
+            for a, b in zip(node.tokens, ids[depth:]):
+                if a != b:
+                    break
+                matched += 1
+            path.append((node, matched))
+            depth += matched
+            if matched < len(node.tokens):
+                break
+        self.clock += 1
+        for node, _ in path:
+            node.last_used = self.clock
+        return path, depth
+
+    def lookup(self, ids):
+        path, depth = self._walk(ids[:len(ids) - 1])
+        if not path:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        segments = [crop_cache(node.past_key_values, matched) for node, matched in path]
+        if len(segments) == 1:
+            return depth, segments[0]
+        return depth, tuple((torch.cat([segment[layer][0] for segment in segments], dim=2),
+                             torch.cat([segment[layer][1] for segment in segments], dim=2))
+                            for layer in range(len(segments[0])))
+
+    def _split(self, node, at):
+        """Cut a node after its first `at` tokens; returns the new upper node."""
+        upper = PrefixNode(node.tokens[:at], tuple((k[:, :, :at].clone(), v[:, :, :at].clone())
+                                                   for k, v in node.past_key_values), node.parent)
+        upper.last_used = node.last_used
+        node.parent.children[node.tokens[0]] = upper
+        node.tokens = node.tokens[at:]
+        node.past_key_values = tuple((k[:, :, at:].clone(), v[:, :, at:].clone()) for k, v in node.past_key_values)
+        node.parent = upper
+        upper.children[node.tokens[0]] = node
+        return upper
+
+    def store(self, ids, past_key_values):
+        path, depth = self._walk(ids)
+        if depth == len(ids):
+            return
+        # Only the positions after the stored prefix are copied; clone so the shared part is not kept alive twice
+        suffix = tuple((k[:, :, depth:].clone(), v[:, :, depth:].clone()) for k, v in past_key_values)
+        size = cache_bytes(suffix)
+        if size > self.max_bytes:
+            return
+        parent = self.root
+        if path:
+            parent, matched = path[-1]
+            if matched < len(parent.tokens):
+                parent = self._split(parent, matched)
+        node = PrefixNode(tuple(ids[depth:]), suffix, parent)
+        node.last_used = self.clock
+        parent.children[ids[depth]] = node
+        self.leaves.discard(parent)
+        self.leaves.add(node)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        leaf = min(self.leaves, key=lambda node: node.last_used)
+        self.leaves.remove(leaf)
+        del leaf.parent.children[leaf.tokens[0]]
+        self.bytes -= cache_bytes(leaf.past_key_values)
+        self.evictions += 1
+        if leaf.parent is not self.root and not leaf.parent.children:
+            self.leaves.add(leaf.parent)
+
+
+def run_prefix_cache_comparison(generator, args):
+    """Generate for every prompt with and without the prefix cache and report prefill tokens saved and time to first token."""
+    tokenizer = generator.tokenizer
+    model = generator.model.eval()
+    prompts = [args.prefix + prompt for prompt in read_prompts(args.prompts_file)]
+    if not prompts:
+        print("No prompts found.")
+        return
+    cache = PrefixCache(int(args.prefix_cache_mb * 1024 * 1024))
+    print(f"\nGenerating up to {args.max_new_tokens} tokens for {len(prompts)} prompts, "
+          f"with a {args.prefix_cache_mb:g} MB prefix cache and without...")
+
+    runs = {"no cache": [], "prefix cache": []}
+    completions = {"no cache": [], "prefix cache": []}
+    for prompt in prompts:
+        for name, prefix_cache in (("no cache", None), ("prefix cache", cache)):
+            stream = TokenStream(model, tokenizer, prompt, args.max_new_tokens,
+                                 temperature=args.temperature, top_k=args.top_k, prefix_cache=prefix_cache)
+            completions[name].append("".join(stream))
+            runs[name].append(stream.metrics)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for prompt, completion in zip(prompts, completions["prefix cache"]):
+                f.write(json.dumps({"prompt": prompt, "completion": completion}, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(prompts)} completions to {args.output}")
+
+    prompt_tokens = sum(m["prompt_tokens"] for m in runs["prefix cache"])
+    reused = sum(m["cached_prompt_tokens"] for m in runs["prefix cache"])
+    print("\n--- Prefix Cache Report ---")
+    print(f"Prompt tokens:        {prompt_tokens}, of which {reused} ({reused / prompt_tokens:.1%}) came from the cache")
+    print(f"Cache lookups:        {cache.hits} hits, {cache.misses} misses, {cache.evictions} evictions")
+    print(f"Cache contents:       {len(cache.leaves)} branches, {cache.bytes / 1024 / 1024:.1f} MB")
+    for name, metrics in runs.items():
+        ttft = sum(m["time_to_first_token"] for m in metrics) / len(metrics)
+        total = sum(m["total_time"] for m in metrics)
+        tokens = sum(m["tokens"] for m in metrics)
+        print(f"{name + ':':<21} mean time to first token {1000 * ttft:.1f} ms, {tokens / total:.1f} tokens/sec")
+    if not args.temperature:
+        same = completions["no cache"] == completions["prefix cache"]
+        print(f"Same output as no cache: {'yes' if same else 'no (numerical ties)'}")
+    print("---------------------------")
+# -------------------------------
+
+# --- Speculative Decoding ---
+def crop_cache(past_key_values, length):
+    """Keep the first length positions of a ((key, value), ...) cache."""
+    return tuple((k[:, :, :length], v[:, :, :length]) for k, v in past_key_values)
+
+
+@torch.no_grad()
+def speculative_generate(target, draft, input_ids, max_new_tokens, num_draft_tokens=4, eos_token_id=None):
+    """
+    Greedy speculative decoding.
+
+    Each round the draft model proposes num_draft_tokens tokens one at a time,
+    then the target model scores all of them in a single forward pass. The
+    longest prefix on which the target agrees is accepted, followed by the
+    target's own next token, so every round commits between 1 and
+    num_draft_tokens + 1 tokens for one target pass. With greedy decoding the
+    output is the same as running the target model alone.
+
+    Both models keep a KV cache; after a rejection the caches are cropped
+    back to the committed tokens. Returns (token_ids, stats).
+    """
+    device = target.device
+    ids = list(input_ids)
+    prompt_length = len(ids)
+    target_cache, target_cached = None, 0
+    draft_cache, draft_cached = None, 0
+    stats = {"drafted": 0, "accepted": 0, "target_passes": 0}
+
+    while len(ids) - prompt_length < max_new_tokens:
+        num_draft = min(num_draft_tokens, max_new_tokens - (len(ids) - prompt_length) - 1)
+
+        # 1. Draft: propose num_draft tokens autoregressively (feeding any tokens it hasn't seen yet first)
+        proposals = []
+        draft_input = ids[draft_cached:]
+        for _ in range(num_draft):
+            outputs = draft(input_ids=torch.tensor([draft_input], device=device), past_key_values=draft_cache, use_cache=True)
+            draft_cache = outputs.past_key_values
+            draft_cached += len(draft_input)
+            next_id = int(outputs.logits[0, -1].argmax())
+            proposals.append(next_id)
+            draft_input = [next_id]
+
+        # 2. Verify: one target pass over the uncached committed tokens plus all proposals
+        target_input = ids[target_cached:] + proposals
+        outputs = target(input_ids=torch.tensor([target_input], device=device), past_key_values=target_cache, use_cache=True)
+        stats["target_passes"] += 1
+        # Target's choice after the last committed token and after each proposal
+        choices = outputs.logits[0, -(num_draft + 1):].argmax(dim=-1).tolist()
+        accepted = 0
+        while accepted < num_draft and proposals[accepted] == choices[accepted]:
+            accepted += 1
+        committed = len(ids)
+        new_ids = proposals[:accepted] + [choices[accepted]]
+        stats["drafted"] += num_draft
+        stats["accepted"] += accepted
+
+        # 3. Commit and roll both caches back to what is still valid
+        ids.extend(new_ids)
+        target_cached = len(ids) - 1
+        target_cache = crop_cache(outputs.past_key_values, target_cached)
+        if draft_cache is not None:
+            draft_cached = min(draft_cached, committed + accepted)
+            draft_cache = crop_cache(draft_cache, draft_cached)
+        if eos_token_id is not None and eos_token_id in new_ids:
+            ids = ids[:ids.index(eos_token_id, committed) + 1]
+            break
+    return ids, stats
+
+
+def run_speculative_comparison(generator, prompt, max_total_length, args):
+    """Time plain greedy decoding against speculative decoding and report acceptance rate and tokens/sec."""
+    tokenizer = generator.tokenizer
+    target = generator.model.eval()
+    print(f"\nLoading draft model '{args.draft_model}'...")
+    draft = AutoModelForCausalLM.from_pretrained(args.draft_model).to(target.device).eval()
+    if draft.config.vocab_size != target.config.vocab_size:
+        raise ValueError(f"Draft model vocabulary ({draft.config.vocab_size}) does not match the target ({target.config.vocab_size})")
+
+    input_ids = tokenizer.encode(prompt)
+    max_new_tokens = max_total_length - len(input_ids)
+    print(f"Generating up to {max_new_tokens} new tokens greedily, {args.num_draft_tokens} draft tokens per pass...")
+
+    # Plain path: the target model alone, one forward pass per token
+    start = time.perf_counter()
+    with torch.no_grad():
+        plain_ids = target.generate(torch.tensor([input_ids], device=target.device), max_new_tokens=max_new_tokens,
+                                    do_sample=False, pad_token_id=tokenizer.eos_token_id)[0].tolist()
+    plain_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    speculative_ids, stats = speculative_generate(target, draft, input_ids, max_new_tokens,
+                                                  args.num_draft_tokens, tokenizer.eos_token_id)
+    speculative_time = time.perf_counter() - start
+
+    plain_new = len(plain_ids) - len(input_ids)
+    speculative_new = len(speculative_ids) - len(input_ids)
+    print("\n--- Generated Text (speculative) ---")
+    print(tokenizer.decode(speculative_ids))
+    print("\n--- Speculative Decoding Report ---")
+    print(f"Plain greedy:        {plain_new} tokens in {plain_time:.2f} s ({plain_new / plain_time:.1f} tokens/sec)")
+    print(f"Speculative:         {speculative_new} tokens in {speculative_time:.2f} s ({speculative_new / speculative_time:.1f} tokens/sec)")
+    print(f"Speed-up:            {plain_time / speculative_time:.2f}x")
+    print(f"Acceptance rate:     {stats['accepted'] / max(stats['drafted'], 1):.1%} ({stats['accepted']}/{stats['drafted']} draft tokens)")
+    print(f"Target passes:       {stats['target_passes']} ({speculative_new / max(stats['target_passes'], 1):.2f} tokens per pass)")
+    print(f"Same output as plain: {'yes' if plain_ids == speculative_ids else 'no (numerical ties)'}")
+    print("-----------------------------------")
+# ----------------------------
+
 # 1. Load the text generation pipeline
 #    - Uses GPT-2 model by default if 'model' isn't specified.
 #    - Downloads and caches the model on the first run.
@@ -29,9 +521,22 @@ except Exception as e:
     print("Please ensure 'transformers' and 'torch' (or 'tensorflow') are installed.")
     exit()
 
+if args.prompts_file:
+    try:
+        if args.prefix_cache:
+            run_prefix_cache_comparison(generator, args)
+        else:
+            run_prompts_file(generator, args)
+    except Exception as e:
+        print(f"Error during batch generation: {e}")
+    print("\nExample finished.")
+    exit()
+
 # 2. Define the starting prompt for the text generation
 #    Using context from the current time/location you provided.
 prompt = f"Thinking about the beautiful weather in Perth on this Friday morning, the future of artificial intelligence seems"
+if args.prompt:
+    prompt = args.prompt
 
 print(f"\nStarting prompt: \"{prompt}...\"")
 
@@ -41,6 +546,30 @@ print(f"\nStarting prompt: \"{prompt}...\"")
 max_total_length = 100  # Generate text up to this total length
 num_sequences = 1       # Generate one possible completion
 
+if args.stream:
+    try:
+        max_new_tokens = max_total_length - len(generator.tokenizer.encode(prompt))
+        stream = TokenStream(generator.model.eval(), generator.tokenizer, prompt, max_new_tokens,
+                             temperature=args.temperature, top_k=args.top_k)
+        print("\n--- Generated Text (streaming) ---")
+        print(prompt, end="", flush=True)
+        for piece in stream:
+            print(piece, end="", flush=True)
+        print()
+        print_stream_metrics(stream.metrics)
+    except Exception as e:
+        print(f"Error during generation: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.speculative:
+    try:
+        run_speculative_comparison(generator, prompt, max_total_length, args)
+    except Exception as e:
+        print(f"Error during speculative generation: {e}")
+    print("\nExample finished.")
+    exit()
+
 print(f"Generating text (up to {max_total_length} tokens)...")
 
 # 4. Run the generation process
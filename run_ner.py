@@ -1,6 +1,15 @@
 # Import the pipeline function and torch
 from transformers import pipeline
 import torch
+import numpy as np
+import argparse
+import collections
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -8,6 +17,311 @@ print("Task: Named Entity Recognition (NER)")
 print("Model: dbmdz/bert-large-cased-finetuned-conll03-english")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the original example text below.
+parser = argparse.ArgumentParser(description="Local named entity recognition example.")
+parser.add_argument("--document", help="Find entities in this text file of any length, using overlapping windows.")
+parser.add_argument("--output", help="JSONL file the entities are streamed to as they are found (default: print them).")
+parser.add_argument("--window-tokens", type=int, default=512, help="Tokens per window, including [CLS] and [SEP] (default: 512).")
+parser.add_argument("--stride", type=int, default=128, help="Tokens shared by neighbouring windows (default: 128).")
+parser.add_argument("--batch-size", type=int, default=8, help="Windows run through the model together (default: 8).")
+parser.add_argument("--block-chars", type=int, default=200000, help="Characters of --document read and tagged at a time (default: 200000).")
+parser.add_argument("--sentence-cache", action="store_true", help="Tag --document sentence by sentence, reusing cached results for sentences seen before.")
+parser.add_argument("--cache-size", type=int, default=100000, help="Sentences kept in the in-memory LRU cache (default: 100000).")
+parser.add_argument("--cache-db", help="SQLite file that keeps the sentence cache between runs (default: memory only).")
+args = parser.parse_args()
+# ----------------------------
+
+# --- Long-document Sliding Windows ---
+def read_blocks(path, block_chars):
+    """
+    Yield (offset, text) blocks of roughly block_chars characters, cut after a
+    line break where possible, so a file of any size is read a piece at a time.
+    """
+    offset = 0
+    carry = ""
+    with open(path, encoding="utf-8") as f:
+        while True:
+            chunk = f.read(block_chars)
+            text = carry + chunk
+            if not chunk:
+                if text:
+                    yield offset, text
+                return
+            cut = text.rfind("\n") + 1 or len(text)
+            yield offset, text[:cut]
+            offset += cut
+            carry = text[cut:]
+
+
+def make_windows(num_tokens, window, stride):
+    """
+    Token ranges [start, end) of overlapping windows covering num_tokens, and
+    the range each window owns: the overlap with the next window is split at
+    its midpoint, so every token takes its label from exactly one window,
+    the one in which it has the most context on both sides.
+    """
+    step = max(window - stride, 1)
+    starts = list(range(0, max(num_tokens - window, 0) + 1, step))
+    if starts[-1] + window < num_tokens:
+        starts.append(num_tokens - window)
+    ranges = [(start, min(start + window, num_tokens)) for start in starts]
+    owned_from = [0] + [(ranges[k][0] + ranges[k - 1][1]) // 2 for k in range(1, len(ranges))]
+    owned = [(owned_from[k], owned_from[k + 1] if k + 1 < len(ranges) else num_tokens) for k in range(len(ranges))]
+    return ranges, owned
+
+
+@torch.no_grad()
+def tag_tokens(model, tokenizer, ids, window, stride, batch_size):
+    """
+    Label every token of a long token sequence. The sequence is cut into
+    overlapping windows that are run through the model batch_size at a time;
+    returns (label_ids, scores, windows) with one label and score per token.
+    """
+    labels = np.zeros(len(ids), dtype=np.int64)
+    scores = np.zeros(len(ids), dtype=np.float32)
+    if not ids:
+        return labels, scores, 0
+    ranges, owned = make_windows(len(ids), window - 2, stride)  # room for [CLS] and [SEP]
+    for batch_start in range(0, len(ranges), batch_size):
+        batch = list(range(batch_start, min(batch_start + batch_size, len(ranges))))
+        inputs = tokenizer.pad({"input_ids": [tokenizer.build_inputs_with_special_tokens(ids[ranges[k][0]:ranges[k][1]])
+                                              for k in batch]}, return_tensors="pt").to(model.device)
+        probabilities = torch.softmax(model(**inputs).logits.float(), dim=-1)
+        best_scores, best_labels = probabilities.max(dim=-1)
+        best_scores, best_labels = best_scores.cpu().numpy(), best_labels.cpu().numpy()
+        for row, k in enumerate(batch):
+            (start, _), (own_start, own_end) = ranges[k], owned[k]
+            # +1 skips [CLS]
+            labels[own_start:own_end] = best_labels[row, own_start - start + 1:own_end - start + 1]
+            scores[own_start:own_end] = best_scores[row, own_start - start + 1:own_end - start + 1]
+    return labels, scores, len(ranges)
+
+
+def group_entities(text, offsets, labels, scores, id2label, base=0):
+    """
+    Yield entities the way aggregation_strategy="simple" groups them:
+    consecutive tokens with the same entity type form one entity, and a B-
+    tag starts a new one. Offsets are shifted by base into document positions.
+    """
+    current = None
+    for (start, end), label, score in zip(offsets, labels, scores):
+        tag = id2label[int(label)]
+        prefix, _, entity_type = tag.rpartition("-")
+        if tag == "O" or current is None or entity_type != current["entity_group"] or prefix == "B":
+            if current is not None:
+                yield finish_entity(text, current, base)
+            current = None if tag == "O" else {"entity_group": entity_type, "start": start, "end": end, "scores": [score]}
+        else:
+            current["end"] = end
+            current["scores"].append(score)
+    if current is not None:
+        yield finish_entity(text, current, base)
+
+
+def finish_entity(text, entity, base):
+    return {"entity_group": entity["entity_group"], "score": float(np.mean(entity["scores"])),
+            "word": text[entity["start"]:entity["end"]], "start": base + entity["start"], "end": base + entity["end"]}
+
+
+# --- Sentence-level Result Cache ---
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def sentence_spans(text):
+    """Yield (start, end) character spans of the sentences in text, without surrounding whitespace."""
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text + "\n"):
+        sentence = text[start:match.start()]
+        if sentence.strip():
+            left = len(sentence) - len(sentence.lstrip())
+            yield start + left, start + len(sentence.rstrip())
+        start = match.end()
+
+
+class SentenceCache:
+    """
+    NER results per sentence, keyed by a SHA-1 hash of the model name and
+    the sentence text. Entity offsets are stored relative to the sentence.
+    The most recently used max_entries sentences are kept in memory; with a
+    db_path every result is also written to SQLite and read back from there
+    on a memory miss, so the cache survives between runs.
+    """
+
+    def __init__(self, model_name, max_entries, db_path=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # hash -> list of entities
+        self.connection = sqlite3.connect(db_path) if db_path else None
+        if self.connection is not None:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS sentences (key TEXT PRIMARY KEY, entities TEXT)")
+        self.memory_hits = self.db_hits = self.misses = 0
+
+    def key(self, sentence):
+        return hashlib.sha1(f"{self.model_name}\n{sentence}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            return self.entries[key]
+        if self.connection is not None:
+            row = self.connection.execute("SELECT entities FROM sentences WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.db_hits += 1
+                entities = json.loads(row[0])
+                # With max_entries 0 this is dropped again at once, so return the loaded copy
+                self.remember(key, entities)
+                return entities
+        self.misses += 1
+        return None
+
+    def put_many(self, results):
+        """Store {key: entities} for freshly tagged sentences."""
+        for key, entities in results.items():
+            self.remember(key, entities)
+        if self.connection is not None:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO sentences VALUES (?, ?)",
+                                            [(key, json.dumps(entities)) for key, entities in results.items()])
+
+    def remember(self, key, entities):
+        self.entries[key] = entities
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+@torch.no_grad()
+def tag_sentences(model, tokenizer, sentences, window, stride, batch_size):
+    """
+    Return the entities of each sentence, with offsets relative to the sentence.
+    Sentences are sorted by token length and run batch_size at a time; a
+    sentence too long for one window goes through the sliding windows instead.
+    """
+    id2label = model.config.id2label
+    encoding = tokenizer(sentences, add_special_tokens=False, return_offsets_mapping=True)
+    results = [None] * len(sentences)
+    short = sorted((i for i, ids in enumerate(encoding["input_ids"]) if len(ids) <= window - 2),
+                   key=lambda i: len(encoding["input_ids"][i]))
+    for i in range(len(sentences)):
+        if len(encoding["input_ids"][i]) > window - 2:
+            labels, scores, _ = tag_tokens(model, tokenizer, encoding["input_ids"][i], window, stride, batch_size)
+            results[i] = list(group_entities(sentences[i], encoding["offset_mapping"][i], labels, scores, id2label))
+    for batch_start in range(0, len(short), batch_size):
+        batch = short[batch_start:batch_start + batch_size]
+        inputs = tokenizer.pad({"input_ids": [tokenizer.build_inputs_with_special_tokens(encoding["input_ids"][i])
+                                              for i in batch]}, return_tensors="pt").to(model.device)
+        best_scores, best_labels = torch.softmax(model(**inputs).logits.float(), dim=-1).max(dim=-1)
+        best_scores, best_labels = best_scores.cpu().numpy(), best_labels.cpu().numpy()
+        for row, i in enumerate(batch):
+            length = len(encoding["input_ids"][i])
+            results[i] = list(group_entities(sentences[i], encoding["offset_mapping"][i], best_labels[row, 1:length + 1],
+                                              best_scores[row, 1:length + 1], id2label))
+    return results
+
+
+def cached_block_entities(model, tokenizer, cache, text, offset):
+    """
+    Entities of a block of text, found sentence by sentence. Cached sentences
+    cost a hash lookup; only the distinct misses are batched to the model.
+    Offsets are shifted from the sentence to the caller's document. Returns
+    (entities, sentences, sentences sent to the model).
+    """
+    spans = list(sentence_spans(text))
+    keys = [cache.key(text[start:end]) for start, end in spans]
+    found = {}
+    for key in dict.fromkeys(keys):
+        entities = cache.get(key)
+        if entities is not None:
+            found[key] = entities
+    missing = {key: text[start:end] for key, (start, end) in zip(keys, spans) if key not in found}
+    if missing:
+        results = tag_sentences(model, tokenizer, list(missing.values()), args.window_tokens, args.stride, args.batch_size)
+        fresh = dict(zip(missing, results))
+        cache.put_many(fresh)
+        found.update(fresh)
+    entities = [dict(entity, start=offset + start + entity["start"], end=offset + start + entity["end"])
+                for key, (start, _) in zip(keys, spans) for entity in found[key]]
+    return entities, len(spans), len(missing)
+
+
+def run_long_document(ner):
+    """Tag --document block by block with overlapping windows and stream entities out as each block finishes."""
+    model, tokenizer = ner.model.eval(), ner.tokenizer
+    id2label = model.config.id2label
+    if args.sentence_cache:
+        run_cached_document(model, tokenizer)
+        return
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    print(f"\nTagging '{args.document}' with {args.window_tokens}-token windows, stride {args.stride}, "
+          f"batch size {args.batch_size}...")
+    start = time.perf_counter()
+    characters = tokens = windows = entities = 0
+    try:
+        for offset, text in read_blocks(args.document, args.block_chars):
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            labels, scores, block_windows = tag_tokens(model, tokenizer, encoding["input_ids"],
+                                                       args.window_tokens, args.stride, args.batch_size)
+            for entity in group_entities(text, encoding["offset_mapping"], labels, scores, id2label, offset):
+                out.write(json.dumps(entity, ensure_ascii=False) + "\n")
+                entities += 1
+            characters += len(text)
+            tokens += len(encoding["input_ids"])
+            windows += block_windows
+    finally:
+        if args.output:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print("NER complete.")
+    if args.output:
+        print(f"Wrote {entities} entities to {args.output}")
+    print("\n--- Long-document NER Report ---")
+    print(f"Characters:          {characters}")
+    print(f"Tokens:              {tokens} in {windows} windows")
+    print(f"Entities:            {entities}")
+    print(f"Total time:          {elapsed:.2f} s ({tokens / elapsed if elapsed > 0 else 0.0:.0f} tokens/sec)")
+    print("--------------------------------")
+
+
+def run_cached_document(model, tokenizer):
+    """Tag --document sentence by sentence through the cache and stream entities out block by block."""
+    cache = SentenceCache(model.name_or_path, args.cache_size, args.cache_db)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    print(f"\nTagging '{args.document}' sentence by sentence, cache of {args.cache_size} sentences"
+          + (f" backed by '{args.cache_db}'" if args.cache_db else "") + f", batch size {args.batch_size}...")
+    start = time.perf_counter()
+    sentences = tagged = entities = 0
+    try:
+        for offset, text in read_blocks(args.document, args.block_chars):
+            block, block_sentences, block_tagged = cached_block_entities(model, tokenizer, cache, text, offset)
+            for entity in block:
+                out.write(json.dumps(entity, ensure_ascii=False) + "\n")
+            entities += len(block)
+            sentences += block_sentences
+            tagged += block_tagged
+    finally:
+        cache.close()
+        if args.output:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print("NER complete.")
+    if args.output:
+        print(f"Wrote {entities} entities to {args.output}")
+    hits = cache.memory_hits + cache.db_hits
+    print("\n--- Sentence Cache Report ---")
+    print(f"Sentences:           {sentences} ({sentences - tagged} reused, {1 - tagged / max(sentences, 1):.1%})")
+    print(f"Cache hits:          {hits} ({cache.memory_hits} memory, {cache.db_hits} SQLite) of {hits + cache.misses} distinct lookups")
+    print(f"Sent to the model:   {tagged} sentences")
+    print(f"Entities:            {entities}")
+    print(f"Total time:          {elapsed:.2f} s ({sentences / elapsed if elapsed > 0 else 0.0:.0f} sentences/sec)")
+    print("-----------------------------")
+# -------------------------------------
+
 # 1. Load the NER pipeline, explicitly specifying the model
 print("Loading NER model (may download on first run)...")
 try:
@@ -30,6 +344,14 @@ except Exception as e:
     print("Please ensure 'transformers', 'sentencepiece', and 'torch' (or 'tensorflow') are installed.")
     exit()
 
+if args.document:
+    try:
+        run_long_document(ner_pipeline)
+    except Exception as e:
+        print(f"Error during NER: {e}")
+    print("\nExample finished.")
+    exit()
+
 # 2. Define the text you want to analyze
 #    Using context relevant to Friday afternoon in Perth
 text_to_analyze = """
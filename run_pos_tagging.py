@@ -1,7 +1,11 @@
 # Import pipeline and torch
-from transformers import pipeline
+from transformers import pipeline, AutoTokenizer
 import torch
+import numpy as np
+import argparse
+import json
 import os
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -9,13 +13,317 @@ print("Task: Part-of-Speech (POS) Tagging")
 print("Model: vblagoje/bert-english-uncased-finetuned-pos")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script tags the example sentence below.
+parser = argparse.ArgumentParser(description="Local BERT part-of-speech tagging example.")
+parser.add_argument("--input", help="Tag every line of this text file in batches, with vectorized word aggregation.")
+parser.add_argument("--output", help="Where to write --input tags: .npz for the columnar arrays, anything else for tab-separated rows (default: print them).")
+parser.add_argument("--batch-size", type=int, default=32, help="Sentences per model call for --input (default: 32).")
+parser.add_argument("--pretokenize", metavar="CORPUS", help="Tokenize --input once and save ids, offsets and word ids to this Arrow file for later --corpus runs.")
+parser.add_argument("--corpus", help="Tag a corpus written by --pretokenize, streaming memory-mapped batches; --output must then be .arrow or .parquet.")
+parser.add_argument("--benchmark", action="store_true", help="Time the pipeline's own word grouping against the vectorized post-processor on --input.")
+args = parser.parse_args()
+# ----------------------------
+
 # --- USER Configuration ---
 # 1. Define the text you want to tag
 #    Using context relevant to late Friday evening in Perth
 text_to_tag = "Late Friday night in Perth. Thinking about getting some sleep soon, but the city lights look nice."
+model_name = "vblagoje/bert-english-uncased-finetuned-pos"
 
 # --------------------------
 
+# --- Vectorized Word Aggregation ---
+def word_id_array(encoding, length):
+    """Word index of every token in a batch encoding, padded to length; -1 for special and padding tokens."""
+    word_ids = np.full((len(encoding["input_ids"]), length), -1, dtype=np.int64)
+    for row in range(len(word_ids)):
+        ids = encoding.word_ids(row)
+        word_ids[row, :len(ids)] = [-1 if w is None else w for w in ids]
+    return word_ids
+
+
+def aggregate_words(logits, word_ids, offsets):
+    """
+    Turn token logits for a whole batch into word-level tags in one pass.
+
+    logits is (batch, tokens, labels), word_ids (batch, tokens) with -1 for
+    tokens that belong to no word, offsets (batch, tokens, 2) character
+    offsets. The sub-word tokens of a word are always next to each other, so
+    after dropping the -1 tokens each word is one run of rows: np.add.reduceat
+    sums the run's probabilities (the "average" strategy: a word's tag is the
+    best label of its averaged sub-word probabilities) and its first and last
+    tokens give the character span.
+
+    Returns columnar arrays, one entry per word: sentence, start, end, tag
+    (label id) and score.
+    """
+    probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probabilities /= probabilities.sum(axis=-1, keepdims=True)
+    rows, columns = np.nonzero(word_ids >= 0)
+    if len(rows) == 0:
+        return empty_columns()
+    words = word_ids[rows, columns]
+    # A new word starts wherever the sentence or the word index changes
+    first = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (words[1:] != words[:-1])])
+    last = np.r_[first[1:], len(rows)] - 1
+    sums = np.add.reduceat(probabilities[rows, columns], first, axis=0)
+    averages = sums / (last - first + 1)[:, None]
+    tags = averages.argmax(axis=-1)
+    return {
+        "sentence": rows[first].astype(np.int32),
+        "start": offsets[rows[first], columns[first], 0].astype(np.int32),
+        "end": offsets[rows[last], columns[last], 1].astype(np.int32),
+        "tag": tags.astype(np.int32),
+        "score": averages[np.arange(len(tags)), tags].astype(np.float32),
+    }
+
+
+@torch.no_grad()
+def tag_batch(model, tokenizer, sentences):
+    """Run one batch of sentences through the model and return (columns, forward seconds, aggregation seconds)."""
+    start = time.perf_counter()
+    encoding = tokenizer(sentences, padding=True, truncation=True, return_offsets_mapping=True, return_tensors="np")
+    offsets = encoding.pop("offset_mapping")
+    inputs = {name: torch.from_numpy(array).to(model.device) for name, array in encoding.items()}
+    logits = model(**inputs).logits.float().cpu().numpy()
+    forward_time = time.perf_counter() - start
+    start = time.perf_counter()
+    columns = aggregate_words(logits, word_id_array(encoding, logits.shape[1]), offsets)
+    return columns, forward_time, time.perf_counter() - start
+
+
+def empty_columns():
+    empty = np.zeros(0, dtype=np.int32)
+    return {"sentence": empty, "start": empty, "end": empty, "tag": empty, "score": np.zeros(0, dtype=np.float32)}
+
+
+def tag_sentences(model, tokenizer, sentences, batch_size):
+    """Tag sentences batch_size at a time; returns the columnar arrays for all of them and the timings."""
+    parts, forward_time, aggregate_time = [], 0.0, 0.0
+    for batch_start in range(0, len(sentences), batch_size):
+        columns, forward, aggregate = tag_batch(model, tokenizer, sentences[batch_start:batch_start + batch_size])
+        columns["sentence"] += batch_start
+        parts.append(columns)
+        forward_time += forward
+        aggregate_time += aggregate
+    if not parts:
+        return empty_columns(), forward_time, aggregate_time
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    return columns, forward_time, aggregate_time
+
+
+def write_tags(path, sentences, columns, labels):
+    if path.endswith(".npz"):
+        np.savez(path, labels=np.array(labels), **columns)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("sentence\tstart\tend\tword\ttag\tscore\n")
+        for sentence, start, end, tag, score in zip(*(columns[name].tolist() for name in ("sentence", "start", "end", "tag", "score"))):
+            f.write(f"{sentence}\t{start}\t{end}\t{sentences[sentence][start:end]}\t{labels[tag]}\t{score:.4f}\n")
+
+
+def run_bulk_tagging(tagger):
+    with open(args.input, encoding="utf-8") as f:
+        sentences = [line.rstrip("\n") for line in f if line.strip()]
+    model, tokenizer = tagger.model.eval(), tagger.tokenizer
+    labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
+    print(f"\nTagging {len(sentences)} sentences from '{args.input}', batch size {args.batch_size}...")
+    columns, forward_time, aggregate_time = tag_sentences(model, tokenizer, sentences, args.batch_size)
+    print("Tagging complete.")
+    if args.output:
+        write_tags(args.output, sentences, columns, labels)
+        print(f"Wrote {len(columns['tag'])} word tags to {args.output}")
+    else:
+        for sentence, start, end, tag, score in zip(*(columns[name].tolist() for name in ("sentence", "start", "end", "tag", "score"))):
+            print(f"{sentence}\t{sentences[sentence][start:end]:<20} Tag: {labels[tag]:<6} Score: {score:.4f}")
+    total = forward_time + aggregate_time
+    if not sentences:
+        print("\nNo sentences to tag.")
+        return
+    print(f"\nTagged {len(columns['tag'])} words in {total:.2f} s ({len(sentences) / total:.1f} sentences/sec); "
+          f"word aggregation took {aggregate_time:.3f} s ({aggregate_time / total:.1%}).")
+
+
+def run_aggregation_benchmark(tagger):
+    """Tag --input with the pipeline (Python word grouping) and with the vectorized post-processor, and compare times."""
+    with open(args.input, encoding="utf-8") as f:
+        sentences = [line.rstrip("\n") for line in f if line.strip()]
+    if not sentences:
+        print("No sentences found.")
+        return
+    model, tokenizer = tagger.model.eval(), tagger.tokenizer
+    print(f"\nBenchmarking word aggregation on {len(sentences)} sentences, batch size {args.batch_size}...")
+    start = time.perf_counter()
+    results = tagger(sentences, batch_size=args.batch_size)
+    pipeline_time = time.perf_counter() - start
+    columns, forward_time, aggregate_time = tag_sentences(model, tokenizer, sentences, args.batch_size)
+    vectorized_time = forward_time + aggregate_time
+    print("\n--- Aggregation Benchmark ---")
+    print(f"Pipeline (aggregation_strategy=\"simple\"): {pipeline_time:.2f} s ({len(sentences) / pipeline_time:.1f} sentences/sec), "
+          f"{sum(len(r) for r in results)} groups")
+    print(f"Batched + vectorized:                     {vectorized_time:.2f} s ({len(sentences) / vectorized_time:.1f} sentences/sec), "
+          f"{len(columns['tag'])} words")
+    print(f"  of which model {forward_time:.2f} s, word aggregation {aggregate_time:.3f} s")
+    print(f"Speed-up: {pipeline_time / vectorized_time:.2f}x")
+    print("-----------------------------")
+# ------------------------------------
+
+# --- Pre-tokenized Arrow Corpus ---
+# pyarrow is only needed for --pretokenize and --corpus
+def list_array(pa, lists, value_type):
+    """Build a list<value_type> Arrow array from Python lists with one flat values buffer."""
+    offsets = np.zeros(len(lists) + 1, dtype=np.int32)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    flat = np.fromiter((value for values in lists for value in values), dtype=value_type, count=offsets[-1])
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(flat))
+
+
+def pretokenize_corpus(tokenizer, input_path, corpus_path, chunk_size=4096):
+    """
+    Tokenize every line of input_path once and write an Arrow IPC file with one
+    row per sentence: text, input_ids (with [CLS]/[SEP]), token_start,
+    token_end and word_ids (-1 for special tokens). The tokenizer name is kept
+    in the schema metadata so a corpus is never tagged with the wrong vocabulary.
+    """
+    import pyarrow as pa
+    schema = pa.schema([("text", pa.string()), ("input_ids", pa.list_(pa.int32())), ("token_start", pa.list_(pa.int32())),
+                        ("token_end", pa.list_(pa.int32())), ("word_ids", pa.list_(pa.int32()))],
+                       metadata={"tokenizer": tokenizer.name_or_path})
+    rows = tokens = 0
+    with open(input_path, encoding="utf-8") as f, pa.OSFile(corpus_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        lines = (line.rstrip("\n") for line in f if line.strip())
+        while True:
+            texts = [line for _, line in zip(range(chunk_size), lines)]
+            if not texts:
+                break
+            encoding = tokenizer(texts, truncation=True, return_offsets_mapping=True)
+            offsets = encoding["offset_mapping"]
+            word_ids = [[-1 if w is None else w for w in encoding.word_ids(i)] for i in range(len(texts))]
+            writer.write_batch(pa.record_batch([
+                pa.array(texts, pa.string()),
+                list_array(pa, encoding["input_ids"], np.int32),
+                list_array(pa, [[start for start, _ in row] for row in offsets], np.int32),
+                list_array(pa, [[end for _, end in row] for row in offsets], np.int32),
+                list_array(pa, word_ids, np.int32),
+            ], schema=schema))
+            rows += len(texts)
+            tokens += sum(len(ids) for ids in encoding["input_ids"])
+    return rows, tokens
+
+
+def padded(column, pad_value):
+    """
+    Turn a list<int32> Arrow column into a (rows, longest) NumPy matrix with no
+    per-row Python work: the flat values buffer is read without copying and
+    scattered into place using the list offsets.
+    """
+    offsets = column.offsets.to_numpy()
+    offsets = offsets - offsets[0]
+    values = column.flatten().to_numpy(zero_copy_only=True)
+    lengths = np.diff(offsets)
+    matrix = np.full((len(lengths), lengths.max() if len(lengths) else 0), pad_value, dtype=np.int64)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    matrix[rows, np.arange(len(values)) - offsets[:-1][rows]] = values
+    return matrix
+
+
+@torch.no_grad()
+def tag_corpus(model, corpus_path, output_path, batch_size, pad_token_id):
+    """
+    Stream batches from a memory-mapped --pretokenize corpus through the model
+    and write word tags as Arrow list columns (start, end, tag, score), one
+    row per corpus sentence, to an Arrow IPC or Parquet file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
+    reader = pa.ipc.open_file(pa.memory_map(corpus_path, "r"))
+    tokenizer_name = (reader.schema.metadata or {}).get(b"tokenizer", b"").decode()
+    if tokenizer_name and tokenizer_name != model.name_or_path:
+        raise ValueError(f"Corpus was tokenized for '{tokenizer_name}', not '{model.name_or_path}'")
+    tag_type = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([("start", pa.list_(pa.int32())), ("end", pa.list_(pa.int32())),
+                        ("tag", pa.list_(tag_type)), ("score", pa.list_(pa.float32()))],
+                       metadata={"model": model.name_or_path, "labels": json.dumps(labels)})
+    label_array = pa.array(labels, pa.string())
+    if output_path.endswith(".parquet"):
+        writer = pq.ParquetWriter(output_path, schema)
+    else:
+        writer = pa.ipc.new_file(pa.OSFile(output_path, "wb"), schema)
+    timings = {"prepare": 0.0, "model": 0.0, "aggregate": 0.0, "write": 0.0}
+    rows = words = 0
+    try:
+        for record_batch_index in range(reader.num_record_batches):
+            record_batch = reader.get_batch(record_batch_index)
+            for batch_start in range(0, record_batch.num_rows, batch_size):
+                batch = record_batch.slice(batch_start, batch_size)  # zero-copy view
+                start = time.perf_counter()
+                input_ids = padded(batch.column("input_ids"), pad_token_id)
+                word_ids = padded(batch.column("word_ids"), -1)
+                offsets = np.stack([padded(batch.column("token_start"), 0), padded(batch.column("token_end"), 0)], axis=-1)
+                attention_mask = (np.arange(input_ids.shape[1]) < np.diff(batch.column("input_ids").offsets.to_numpy())[:, None]).astype(np.int64)
+                timings["prepare"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                logits = model(input_ids=torch.from_numpy(input_ids).to(model.device),
+                               attention_mask=torch.from_numpy(attention_mask).to(model.device)).logits.float().cpu().numpy()
+                timings["model"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                columns = aggregate_words(logits, word_ids, offsets)
+                timings["aggregate"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                list_offsets = pa.array(np.searchsorted(columns["sentence"], np.arange(batch.num_rows + 1)).astype(np.int32))
+                writer.write_batch(pa.record_batch([
+                    pa.ListArray.from_arrays(list_offsets, pa.array(columns["start"])),
+                    pa.ListArray.from_arrays(list_offsets, pa.array(columns["end"])),
+                    pa.ListArray.from_arrays(list_offsets, pa.DictionaryArray.from_arrays(pa.array(columns["tag"]), label_array)),
+                    pa.ListArray.from_arrays(list_offsets, pa.array(columns["score"])),
+                ], schema=schema))
+                timings["write"] += time.perf_counter() - start
+                rows += batch.num_rows
+                words += len(columns["tag"])
+    finally:
+        writer.close()
+    return rows, words, timings
+
+
+def run_pretokenize(tokenizer):
+    print(f"\nPre-tokenizing '{args.input}' into '{args.pretokenize}'...")
+    start = time.perf_counter()
+    rows, tokens = pretokenize_corpus(tokenizer, args.input, args.pretokenize)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {rows} sentences ({tokens} tokens) in {elapsed:.2f} s.")
+
+
+def run_corpus_tagging(tagger):
+    if not args.output or not args.output.endswith((".arrow", ".parquet")):
+        raise ValueError("--corpus needs an --output file ending in .arrow or .parquet")
+    print(f"\nTagging pre-tokenized corpus '{args.corpus}', batch size {args.batch_size}...")
+    start = time.perf_counter()
+    rows, words, timings = tag_corpus(tagger.model.eval(), args.corpus, args.output, args.batch_size,
+                                      tagger.tokenizer.pad_token_id)
+    elapsed = time.perf_counter() - start
+    print("Tagging complete.")
+    print(f"Wrote tags for {rows} sentences ({words} words) to {args.output}")
+    print("\n--- Corpus Tagging Report ---")
+    print(f"Total time:          {elapsed:.2f} s ({rows / elapsed if elapsed > 0 else 0.0:.1f} sentences/sec)")
+    for stage, seconds in timings.items():
+        print(f"  {stage + ':':<18} {seconds:.3f} s ({seconds / elapsed if elapsed > 0 else 0.0:.1%})")
+    print("-----------------------------")
+# -----------------------------------
+
+# Pre-tokenizing only needs the tokenizer, not the model
+if args.pretokenize:
+    try:
+        run_pretokenize(AutoTokenizer.from_pretrained(model_name))
+    except Exception as e:
+        print(f"Error during pre-tokenization: {e}")
+    print("\nExample finished.")
+    exit()
+
 # --- Model Loading ---
 print("\nLoading POS Tagging model (may download on first run)...")
 try:
@@ -23,7 +331,7 @@ try:
     # aggregation_strategy="simple" groups sub-word tokens (like ##ing) into whole words
     tagger = pipeline(
         "token-classification",
-        model="vblagoje/bert-english-uncased-finetuned-pos",
+        model=model_name,
         aggregation_strategy="simple", # Get word-level tags
         device=0 if torch.cuda.is_available() else -1
         )
@@ -38,6 +346,25 @@ except Exception as e:
     exit()
 # ----------------------
 
+if args.corpus:
+    try:
+        run_corpus_tagging(tagger)
+    except Exception as e:
+        print(f"Error during POS Tagging: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.input:
+    try:
+        if args.benchmark:
+            run_aggregation_benchmark(tagger)
+        else:
+            run_bulk_tagging(tagger)
+    except Exception as e:
+        print(f"Error during POS Tagging: {e}")
+    print("\nExample finished.")
+    exit()
+
 # --- POS Tagging ---
 print(f"\nInput Text:\n\"{text_to_tag}\"")
 print("\nPerforming POS Tagging...")
@@ -1,6 +1,8 @@
 # Import the pipeline function and torch
 from transformers import pipeline
 import torch
+import argparse
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -8,6 +10,199 @@ print("Task: Question Answering (Extractive)")
 print("Model: distilbert-base-cased-distilled-squad")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script answers the single example question below.
+parser = argparse.ArgumentParser(description="Local extractive question answering example.")
+parser.add_argument("--questions", help="Text file with one question per line, all asked about the same context.")
+parser.add_argument("--context-file", help="Text file to use as the context instead of the example paragraph.")
+parser.add_argument("--batch-size", type=int, default=32, help="Question/context pairs per forward pass (default: 32).")
+parser.add_argument("--max-answer-tokens", type=int, default=15, help="Longest answer span in tokens (default: 15).")
+parser.add_argument("--compare", action="store_true", help="Also answer every question with its own pipeline call and compare latency per question.")
+parser.add_argument("--document", help="Stream a text file of any length as the context, answering --questions (or the example question) over overlapping windows.")
+parser.add_argument("--max-length", type=int, default=384, help="Tokens per question/context window (default: 384).")
+parser.add_argument("--doc-stride", type=int, default=128, help="Tokens shared by neighbouring context windows (default: 128).")
+parser.add_argument("--block-chars", type=int, default=100000, help="Characters of --document read at a time (default: 100000).")
+args = parser.parse_args()
+# ----------------------------
+
+# --- Batched Multi-question QA ---
+def best_spans(start_logits, end_logits, context_mask, max_answer_tokens):
+    """
+    Pick the best answer span in every row of a batch at once.
+
+    Like the pipeline, start and end logits are turned into probabilities
+    over the context tokens (plus [CLS], which takes part in the softmax but
+    can never be the answer), and a span's score is P(start) * P(end). All
+    (start, end) pairs of a row are scored as one matrix, masked to
+    start <= end < start + max_answer_tokens, and the best is found with a
+    single argmax. Returns (starts, ends, scores) tensors, one entry per row.
+    """
+    length = start_logits.shape[1]
+    softmax_mask = context_mask.clone()
+    softmax_mask[:, 0] = True
+    start_probabilities = torch.softmax(start_logits.masked_fill(~softmax_mask, -10000.0), dim=-1) * context_mask
+    end_probabilities = torch.softmax(end_logits.masked_fill(~softmax_mask, -10000.0), dim=-1) * context_mask
+    band = torch.ones(length, length, dtype=torch.bool, device=start_logits.device)
+    band = band.triu().tril(max_answer_tokens - 1)
+    scores = (start_probabilities[:, :, None] * end_probabilities[:, None, :]).masked_fill(~band, 0.0).flatten(1)
+    best_scores, best = scores.max(dim=-1)
+    return best // length, best % length, best_scores
+
+
+def read_blocks(path, block_chars, overlap_chars):
+    """
+    Yield (offset, text) blocks of about block_chars characters from a file of
+    any size. Each block repeats the last overlap_chars characters of the one
+    before (from a word boundary), so an answer cut by a block boundary is
+    still seen whole.
+    """
+    offset, carry = 0, ""
+    with open(path, encoding="utf-8") as f:
+        while True:
+            chunk = f.read(block_chars)
+            if not chunk:
+                return
+            text = carry + chunk
+            yield offset, text
+            keep = max(len(text) - overlap_chars, 0)
+            while keep < len(text) and not text[keep].isspace():
+                keep += 1
+            offset += keep
+            carry = text[keep:]
+
+
+def window_starts(num_tokens, room, doc_stride):
+    """Start positions of windows of up to room tokens that overlap by doc_stride tokens and cover num_tokens, as the tokenizer's overflow does."""
+    starts = [0]
+    while starts[-1] + room < num_tokens:
+        starts.append(starts[-1] + room - doc_stride)
+    return starts
+
+
+@torch.no_grad()
+def answer_over_blocks(model, tokenizer, blocks, questions, batch_size=32, max_answer_tokens=15, max_length=384,
+                       doc_stride=128, stats=None):
+    """
+    Answer many questions about a context that arrives as (offset, text) blocks.
+
+    Each block is tokenized once and cut into windows that overlap by
+    doc_stride tokens, sized so each question and its window fit in
+    max_length (the same windows the pipeline would use; questions of equal
+    length share them). Every (question, window) pair of the block is run
+    through the model batch_size at a time, the best span of every pair is
+    found with best_spans, and each question keeps the highest-scoring
+    answer seen so far, so only one block is held in memory at a time.
+    Answers are widened to whole words, as the pipeline does. Returns one
+    {"answer", "score", "start", "end"} dict per question, with character
+    offsets into the whole context.
+    """
+    question_ids = tokenizer(questions, add_special_tokens=False)["input_ids"]
+    rooms = [max_length - len(ids) - tokenizer.num_special_tokens_to_add(pair=True) for ids in question_ids]
+    if min(rooms) <= doc_stride:
+        raise ValueError(f"The longest question leaves {min(rooms)} context tokens per window, not more than doc_stride ({doc_stride})")
+    best = [{"answer": "", "score": 0.0, "start": 0, "end": 0} for _ in questions]
+    stats = stats if stats is not None else {}
+    for offset, text in blocks:
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        ids = encoded["input_ids"]
+        if not ids:
+            continue
+        # Character span of the whole word each token belongs to, so answers never cut a word in half
+        word_offsets = [encoded.word_to_chars(word) if word is not None else offsets
+                        for word, offsets in zip(encoded.word_ids(), encoded["offset_mapping"])]
+        windows = {room: window_starts(len(ids), room, doc_stride) for room in set(rooms)}
+        pairs = [(question, window) for question, room in enumerate(rooms) for window in windows[room]]
+        stats["windows"] = stats.get("windows", 0) + max(len(starts) for starts in windows.values())
+        stats["tokens"] = stats.get("tokens", 0) + len(ids)
+        stats["pairs"] = stats.get("pairs", 0) + len(pairs)
+        for batch_start in range(0, len(pairs), batch_size):
+            batch = pairs[batch_start:batch_start + batch_size]
+            rows, context_starts = [], []
+            for question, window in batch:
+                context = ids[window:window + rooms[question]]
+                row = tokenizer.build_inputs_with_special_tokens(question_ids[question], context)
+                rows.append(row)
+                # [CLS] question [SEP] context [SEP]: the context ends one token before the row does
+                context_starts.append(len(row) - len(context) - 1)
+            inputs = tokenizer.pad({"input_ids": rows}, return_tensors="pt").to(model.device)
+            outputs = model(**inputs)
+            positions = torch.arange(inputs["input_ids"].shape[1], device=model.device)
+            context_start_tensor = torch.tensor(context_starts, device=model.device)[:, None]
+            lengths = torch.tensor([len(row) for row in rows], device=model.device)[:, None]
+            context_mask = (positions >= context_start_tensor) & (positions < lengths - 1)
+            starts, ends, scores = best_spans(outputs.start_logits.float(), outputs.end_logits.float(),
+                                              context_mask, max_answer_tokens)
+            for (question, window), start, end, score, context_start in zip(batch, starts.tolist(), ends.tolist(),
+                                                                            scores.tolist(), context_starts):
+                if score > best[question]["score"]:
+                    char_start = word_offsets[window + start - context_start][0]
+                    char_end = word_offsets[window + end - context_start][1]
+                    best[question] = {"answer": text[char_start:char_end], "score": score,
+                                      "start": offset + char_start, "end": offset + char_end}
+    return best
+
+
+def answer_questions(model, tokenizer, context, questions, batch_size=32, max_answer_tokens=15, max_length=384, doc_stride=128):
+    """
+    Answer many questions about one context string. The context is tokenized
+    once and shared by every question; a context longer than one window is
+    covered by overlapping windows (see answer_over_blocks).
+    """
+    return answer_over_blocks(model, tokenizer, [(0, context)], questions, batch_size, max_answer_tokens,
+                              max_length, doc_stride)
+
+
+def run_multi_question(qa, context):
+    with open(args.questions, encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    model, tokenizer = qa.model.eval(), qa.tokenizer
+    print(f"\nAnswering {len(questions)} questions about one context ({len(context)} characters), "
+          f"batch size {args.batch_size}...")
+    start = time.perf_counter()
+    answers = answer_questions(model, tokenizer, context, questions, args.batch_size, args.max_answer_tokens,
+                               args.max_length, args.doc_stride)
+    batched_time = time.perf_counter() - start
+    print("Answer extraction complete.")
+    print("\n--- Extracted Answers ---")
+    for question, answer in zip(questions, answers):
+        print(f"Question: {question}")
+        print(f"Answer:   \"{answer['answer']}\" (confidence {answer['score']:.4f})")
+    print("-------------------------")
+    print(f"\nBatched: {batched_time:.2f} s ({1000 * batched_time / len(questions):.1f} ms per question)")
+    if args.compare:
+        start = time.perf_counter()
+        single = [qa(question=question, context=context, max_answer_len=args.max_answer_tokens,
+                     max_seq_len=args.max_length, doc_stride=args.doc_stride) for question in questions]
+        single_time = time.perf_counter() - start
+        same = sum(answer["answer"].strip() == result["answer"].strip() for answer, result in zip(answers, single))
+        print(f"One pipeline call per question: {single_time:.2f} s ({1000 * single_time / len(questions):.1f} ms per question)")
+        print(f"Speed-up: {single_time / batched_time:.2f}x; same answer for {same} of {len(questions)} questions")
+
+
+def run_long_context(qa, questions):
+    model, tokenizer = qa.model.eval(), qa.tokenizer
+    print(f"\nAnswering {len(questions)} question(s) over '{args.document}' with {args.max_length}-token windows, "
+          f"doc stride {args.doc_stride}, batch size {args.batch_size}...")
+    stats = {}
+    start = time.perf_counter()
+    # Blocks overlap by a few windows' worth of text so no answer is lost at a block boundary
+    blocks = read_blocks(args.document, args.block_chars, overlap_chars=8 * args.max_length)
+    answers = answer_over_blocks(model, tokenizer, blocks, questions, args.batch_size, args.max_answer_tokens,
+                                 args.max_length, args.doc_stride, stats)
+    elapsed = time.perf_counter() - start
+    print("Answer extraction complete.")
+    print("\n--- Extracted Answers ---")
+    for question, answer in zip(questions, answers):
+        print(f"Question: {question}")
+        print(f"Answer:   \"{answer['answer']}\" (confidence {answer['score']:.4f}, characters {answer['start']}-{answer['end']})")
+    print("-------------------------")
+    print("\n--- Long-context Report ---")
+    print(f"Context tokens:      {stats.get('tokens', 0)} in {stats.get('windows', 0)} windows")
+    print(f"Forward rows:        {stats.get('pairs', 0)} question/window pairs, {args.batch_size} per pass")
+    print(f"Total time:          {elapsed:.2f} s ({stats.get('tokens', 0) / elapsed if elapsed > 0 else 0.0:.0f} context tokens/sec)")
+    print("---------------------------")
+# --------------------------------
+
 # 1. Load the Question Answering pipeline, explicitly specifying the model
 print("Loading QA model (may download on first run)...")
 try:
@@ -44,6 +239,30 @@ question = "What event is causing setup crews to be busy in the central business
 # Another possible question: "Where might people go after work?"
 # Another possible question: "What road has major roadworks?"
 
+if args.context_file:
+    with open(args.context_file, encoding="utf-8") as f:
+        context = f.read()
+
+if args.document:
+    try:
+        questions = [question]
+        if args.questions:
+            with open(args.questions, encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        run_long_context(qa_pipeline, questions)
+    except Exception as e:
+        print(f"Error during Question Answering: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.questions:
+    try:
+        run_multi_question(qa_pipeline, context)
+    except Exception as e:
+        print(f"Error during Question Answering: {e}")
+    print("\nExample finished.")
+    exit()
+
 print(f"\nContext:\n\"{context}\"")
 print(f"\nQuestion: {question}")
 
@@ -1,12 +1,163 @@
 # Import the pipeline function from the transformers library
 from transformers import pipeline
 import torch # Import torch to ensure it's detected (if you installed it)
+import argparse
+import csv
+import json
+import os
+import sys
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
 print("Task: Sentiment Analysis")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the small built-in example below.
+# Pass --input to switch to bulk mode, which streams a large file through the model.
+parser = argparse.ArgumentParser(description="Local sentiment analysis example.")
+parser.add_argument("--input", help="Bulk mode: JSONL, CSV or plain text file (one sentence per line) to classify.")
+parser.add_argument("--output", help="Bulk mode: where to write the labels (.jsonl, .csv or tab-separated text).")
+parser.add_argument("--text-field", default="text", help="Field holding the sentence in JSONL/CSV input (default: text).")
+parser.add_argument("--batch-size", type=int, default=32, help="Sentences per forward pass (default: 32).")
+parser.add_argument("--sort-window", type=int, default=64, help="Batches read ahead and sorted by length together (default: 64).")
+parser.add_argument("--report-every", type=int, default=10000, help="Print throughput every N sentences (default: 10000).")
+args = parser.parse_args()
+if args.input and not args.output:
+    parser.error("--output is required together with --input")
+if args.batch_size < 1 or args.sort_window < 1:
+    parser.error("--batch-size and --sort-window must be at least 1")
+# ----------------------------
+
+# --- Bulk Mode Helpers ---
+def read_sentences(path, text_field):
+    """Yield (record, text) pairs one at a time so the input is never held in memory."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension in (".jsonl", ".ndjson"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record, str(record[text_field])
+        elif extension == ".csv":
+            for record in csv.DictReader(f):
+                yield record, record[text_field]
+        else:
+            for line in f:
+                text = line.rstrip("\n")
+                if text.strip():
+                    yield None, text
+
+
+class LabelWriter:
+    """Write one output row per sentence, in the format implied by the output file extension."""
+
+    def __init__(self, path):
+        self.extension = os.path.splitext(path)[1].lower()
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.csv_writer = None
+
+    def write(self, record, text, label, score):
+        if self.extension in (".jsonl", ".ndjson"):
+            row = dict(record) if record is not None else {"text": text}
+            row["label"] = label
+            row["score"] = round(score, 6)
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        elif self.extension == ".csv":
+            row = dict(record) if record is not None else {"text": text}
+            row["label"] = label
+            row["score"] = f"{score:.6f}"
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.file, fieldnames=list(row.keys()))
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(row)
+        else:
+            self.file.write(f"{label}\t{score:.6f}\t{text}\n")
+
+    def close(self):
+        self.file.close()
+
+
+@torch.no_grad()
+def classify_window(classifier, window, batch_size):
+    """
+    Classify one read-ahead window of (record, text) pairs.
+    Sentences are tokenized once, sorted by token length and cut into batches,
+    so each batch only pads up to its own longest sentence. The batches go
+    straight to the model with the same encodings, and the labels and scores
+    are worked out as the pipeline does. Results come back in input order.
+    """
+    model, tokenizer = classifier.model, classifier.tokenizer
+    texts = [text for _, text in window]
+    encodings = tokenizer(texts, truncation=True)["input_ids"]
+    lengths = [len(ids) for ids in encodings]
+    order = sorted(range(len(texts)), key=lengths.__getitem__)
+
+    results = [None] * len(texts)
+    padded_tokens = 0
+    for start in range(0, len(order), batch_size):
+        batch_ids = order[start:start + batch_size]
+        # Sorted input means the last sentence in the batch is the longest one
+        padded_tokens += lengths[batch_ids[-1]] * len(batch_ids)
+        inputs = tokenizer.pad({"input_ids": [encodings[i] for i in batch_ids]}, return_tensors="pt").to(model.device)
+        logits = model(**inputs).logits.float()
+        # Single-logit models score with a sigmoid, the rest with a softmax, as in the pipeline
+        probs = logits.sigmoid() if logits.shape[-1] == 1 else logits.softmax(dim=-1)
+        scores, labels = probs.max(dim=-1)
+        for i, label, score in zip(batch_ids, labels.tolist(), scores.tolist()):
+            results[i] = {"label": model.config.id2label[label], "score": score}
+    return results, sum(lengths), padded_tokens
+
+
+def run_bulk_mode(classifier, args):
+    """Stream the input file through the classifier with constant memory and report throughput."""
+    classifier.model.eval()
+    print(f"\nBulk mode: reading '{args.input}', writing '{args.output}'")
+    print(f"Batch size: {args.batch_size}, sort window: {args.sort_window} batches")
+    writer = LabelWriter(args.output)
+    window_size = args.batch_size * args.sort_window
+    total = 0
+    real_tokens = 0
+    padded_tokens = 0
+    next_report = args.report_every
+    start_time = time.perf_counter()
+
+    def flush(window):
+        nonlocal total, real_tokens, padded_tokens, next_report
+        results, window_tokens, window_padded = classify_window(classifier, window, args.batch_size)
+        for (record, text), result in zip(window, results):
+            writer.write(record, text, result["label"], result["score"])
+        total += len(window)
+        real_tokens += window_tokens
+        padded_tokens += window_padded
+        if total >= next_report:
+            elapsed = time.perf_counter() - start_time
+            print(f"  {total} sentences, {total / elapsed:.1f} sentences/sec", file=sys.stderr)
+            next_report += args.report_every
+
+    try:
+        window = []
+        for item in read_sentences(args.input, args.text_field):
+            window.append(item)
+            if len(window) == window_size:
+                flush(window)
+                window = []
+        if window:
+            flush(window)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    print("\n--- Bulk Summary ---")
+    print(f"Sentences classified: {total}")
+    print(f"Elapsed time:         {elapsed:.2f} s")
+    print(f"Throughput:           {total / elapsed if elapsed > 0 else 0.0:.1f} sentences/sec")
+    if padded_tokens:
+        print(f"Padding overhead:     {100.0 * (padded_tokens - real_tokens) / padded_tokens:.1f}% of batched tokens")
+    print("--------------------")
+# -------------------------
+
 # 1. Load the sentiment analysis pipeline
 #    - The first time you run this, it will download the model files
 #      (e.g., 'distilbert-base-uncased-finetuned-sst-2-english') and cache them locally.
@@ -33,6 +184,14 @@ except Exception as e:
     print("Please ensure 'transformers' and 'torch' (or 'tensorflow') are installed.")
     exit()
 
+if args.input:
+    try:
+        run_bulk_mode(classifier, args)
+    except Exception as e:
+        print(f"Error during bulk analysis: {e}")
+    print("\nExample finished.")
+    exit()
+
 # 2. Prepare your input data (a list of sentences)
 sentences = [
     "Running AI models locally is quite empowering!",
@@ -1,6 +1,15 @@
 # Import the pipeline function and torch
 from transformers import pipeline
 import torch
+import argparse
+import collections
+import copy
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -8,6 +17,361 @@ print("Task: Text Summarization")
 print("Model: facebook/bart-large-cnn")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the original single-text example below.
+parser = argparse.ArgumentParser(description="Local BART summarisation example.")
+parser.add_argument("--document", help="Text file to summarise instead of the example text.")
+parser.add_argument("--long-document", action="store_true", help="Map-reduce mode: summarise overlapping chunks of the document, then summarise the chunk summaries.")
+parser.add_argument("--chunk-tokens", type=int, default=900, help="Maximum tokens per chunk in --long-document mode (default: 900, the model window is 1024).")
+parser.add_argument("--overlap-sentences", type=int, default=1, help="Sentences repeated at the start of the next chunk (default: 1).")
+parser.add_argument("--chunk-summary-length", type=int, default=80, help="Maximum tokens in each chunk summary (default: 80).")
+parser.add_argument("--batch-size", type=int, default=4, help="Chunks summarised per model call (default: 4).")
+parser.add_argument("--workers", type=int, default=1, help="Worker processes summarising chunk batches in parallel on CPU (default: 1).")
+parser.add_argument("--articles", help="Summarise every article in this file (.jsonl with a text field, or a text file with articles separated by blank lines).")
+parser.add_argument("--text-field", default="text", help="Field holding the article in a .jsonl --articles file (default: text).")
+parser.add_argument("--output", help="JSONL file for --articles summaries, written in input order (default: print them).")
+parser.add_argument("--quantize", action="store_true", help="Run BART with dynamic int8 quantized linear layers (CPU only).")
+parser.add_argument("--compare", action="store_true", help="Summarise --articles with fp32 and int8 weights and report throughput and ROUGE of int8 against fp32.")
+parser.add_argument("--compare-sample", type=int, default=50, help="Articles used by --compare (default: 50).")
+parser.add_argument("--extractive-budget", type=int, help="Keep only the most central sentences, up to this many tokens, before BART sees the text.")
+args = parser.parse_args()
+# ----------------------------
+
+# --- Long-document Map-Reduce ---
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+
+def chunk_sentences(tokenizer, sentences, chunk_tokens, overlap_sentences):
+    """
+    Pack consecutive sentences into chunks of at most chunk_tokens tokens.
+    Each chunk starts with the last overlap_sentences sentences of the one
+    before it (when they fit), so a point that straddles a boundary is seen
+    whole by at least one chunk. A sentence longer than a chunk on its own is
+    cut into token-bounded pieces.
+    """
+    pieces = []
+    for sentence, ids in zip(sentences, tokenizer(sentences, add_special_tokens=False)["input_ids"]):
+        if len(ids) <= chunk_tokens:
+            pieces.append((sentence, len(ids)))
+        else:
+            for start in range(0, len(ids), chunk_tokens):
+                piece = ids[start:start + chunk_tokens]
+                pieces.append((tokenizer.decode(piece), len(piece)))
+
+    chunks, current, current_tokens = [], [], 0
+    for sentence, length in pieces:
+        if current and current_tokens + length > chunk_tokens:
+            chunks.append(" ".join(text for text, _ in current))
+            # Carry the overlap forward, dropping sentences until the new one fits
+            current = current[-overlap_sentences:] if overlap_sentences > 0 else []
+            while current and sum(n for _, n in current) + length > chunk_tokens:
+                current.pop(0)
+            current_tokens = sum(n for _, n in current)
+        current.append((sentence, length))
+        current_tokens += length
+    if current:
+        chunks.append(" ".join(text for text, _ in current))
+    return chunks
+
+
+def summarise_batch(texts, max_length, min_length, batch_size):
+    """Summarise a list of texts with the global pipeline (inherited by forked workers)."""
+    results = summarizer(texts, max_length=max_length, min_length=min_length, do_sample=False,
+                         truncation=True, batch_size=batch_size)
+    return [result["summary_text"].strip() for result in results]
+
+
+def init_summary_worker(threads):
+    torch.set_num_threads(threads)
+
+
+def summary_pool(workers):
+    """
+    Worker pool for map_reduce_summary, or None with one worker or on a GPU.
+    Workers are forked (the script has no __main__ guard) and share the loaded
+    model, so the pool must be created before the parent runs any forward
+    pass: forking after OpenMP threads have started leaves workers hanging.
+    The caller owns the pool and can reuse it for several documents.
+    """
+    if workers <= 1 or torch.cuda.is_available():
+        return None
+    context = multiprocessing.get_context("fork")
+    return context.Pool(workers, initializer=init_summary_worker,
+                        initargs=(max(1, (os.cpu_count() or 1) // workers),))
+
+
+def summarise_chunks(pool, chunks, max_length, min_length, batch_size):
+    """Summarise chunks in batches, spread over the worker pool when there is one; results are in chunk order."""
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    tasks = [(batch, max_length, min_length, batch_size) for batch in batches]
+    results = pool.starmap(summarise_batch, tasks) if pool else [summarise_batch(*task) for task in tasks]
+    return [summary for batch in results for summary in batch]
+
+
+def map_reduce_summary(text, args, max_length, min_length, pool=None):
+    """
+    Summarise a document of any length.
+
+    Map: the document is split on sentence boundaries into overlapping
+    token-bounded chunks and every chunk is summarised. Reduce: the chunk
+    summaries are joined and, while they are still longer than one chunk,
+    chunked and summarised again; the final pass produces the summary. Each
+    chunk costs the same, and every reduce round is several times shorter
+    than the one before, so total time grows linearly with document length.
+    Chunk batches are spread over pool (see summary_pool) when one is given.
+    """
+    tokenizer = summarizer.tokenizer
+    stats = {"document_tokens": len(tokenizer(text, add_special_tokens=False)["input_ids"]), "rounds": []}
+    while True:
+        chunks = chunk_sentences(tokenizer, split_sentences(text), args.chunk_tokens, args.overlap_sentences)
+        if len(chunks) <= 1:
+            break
+        start = time.perf_counter()
+        summaries = summarise_chunks(pool, chunks, args.chunk_summary_length,
+                                     min(min_length, args.chunk_summary_length), args.batch_size)
+        stats["rounds"].append((len(chunks), time.perf_counter() - start))
+        text = "\n".join(summaries)
+        # Stop if a round no longer shrinks the text (e.g. a very small --chunk-tokens)
+        if len(stats["rounds"]) > 1 and len(chunks) >= stats["rounds"][-2][0]:
+            break
+    start = time.perf_counter()
+    summary = summarise_batch([text], max_length, min_length, 1)[0]
+    stats["rounds"].append((1, time.perf_counter() - start))
+    return summary, stats
+
+
+def run_long_document(text, max_length, min_length):
+    print(f"\nSummarising with map-reduce: chunks of up to {args.chunk_tokens} tokens, "
+          f"batch size {args.batch_size}, {args.workers} worker(s)...")
+    pool = summary_pool(args.workers)
+    start = time.perf_counter()
+    try:
+        summary, stats = map_reduce_summary(text, args, max_length, min_length, pool)
+    finally:
+        if pool:
+            pool.terminate()
+    elapsed = time.perf_counter() - start
+    print("Summarization complete.")
+    print("\n--- Generated Summary ---")
+    print(summary)
+    print("-------------------------")
+    print("\n--- Map-Reduce Report ---")
+    print(f"Document tokens:     {stats['document_tokens']}")
+    for i, (chunks, seconds) in enumerate(stats["rounds"]):
+        stage = "Map" if i == 0 and len(stats["rounds"]) > 1 else "Reduce"
+        print(f"{f'{stage} round {i + 1}:':<21}{chunks} chunk(s) in {seconds:.2f} s")
+    print(f"Total time:          {elapsed:.2f} s ({stats['document_tokens'] / elapsed:.1f} document tokens/sec)")
+    print("-------------------------")
+# --------------------------------
+
+# --- Extractive Pre-filter ---
+def tfidf_centrality(sentences):
+    """
+    Score each sentence by the cosine similarity of its TF-IDF vector to the
+    whole document's, so sentences about the document's main topics score
+    highest and asides score lowest.
+    """
+    words = [re.findall(r"\w+", sentence.lower()) for sentence in sentences]
+    document_frequency = collections.Counter(word for sentence in words for word in set(sentence))
+    idf = {word: math.log(len(sentences) / df) + 1.0 for word, df in document_frequency.items()}
+    vectors = [{word: count * idf[word] for word, count in collections.Counter(sentence).items()} for sentence in words]
+    centroid = collections.Counter()
+    for vector in vectors:
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(v * v for v in centroid.values())) or 1.0
+    scores = []
+    for vector in vectors:
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        dot = sum(weight * centroid[word] for word, weight in vector.items())
+        scores.append(dot / (norm * centroid_norm) if norm else 0.0)
+    return scores
+
+
+def extractive_filter(text, tokenizer, budget):
+    """
+    Cut text down to at most budget tokens by keeping the highest-scoring
+    sentences, in their original order. Returns (text, original_tokens, kept_tokens).
+    """
+    sentences = split_sentences(text)
+    lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]] if sentences else []
+    total = sum(lengths)
+    if total <= budget:
+        return text, total, total
+    kept, used = [], 0
+    scores = tfidf_centrality(sentences)
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        if used + lengths[i] <= budget:
+            kept.append(i)
+            used += lengths[i]
+    return " ".join(sentences[i] for i in sorted(kept)), total, used
+
+
+def run_extractive_comparison(text, max_length, min_length):
+    """Summarise the full text and the pre-filtered text and report the token reduction and latency saving."""
+    # One pool for both passes, forked before the parent's first forward pass (see summary_pool)
+    pool = summary_pool(args.workers) if args.long_document else None
+    summarise = (lambda t: map_reduce_summary(t, args, max_length, min_length, pool)[0]) if args.long_document \
+        else (lambda t: summarise_batch([t], max_length, min_length, 1)[0])
+    print(f"\nSummarising the full text, then the text cut to {args.extractive_budget} tokens by TF-IDF sentence scoring...")
+    try:
+        start = time.perf_counter()
+        full_summary = summarise(text)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered, original_tokens, kept_tokens = extractive_filter(text, summarizer.tokenizer, args.extractive_budget)
+        filter_time = time.perf_counter() - start
+        filtered_summary = summarise(filtered)
+        filtered_time = time.perf_counter() - start
+    finally:
+        if pool:
+            pool.terminate()
+    print("Summarization complete.")
+
+    print("\n--- Generated Summary (pre-filtered) ---")
+    print(filtered_summary)
+    print("----------------------------------------")
+    print("\n--- Summary of the full text ---")
+    print(full_summary)
+    print("--------------------------------")
+    print("\n--- Extractive Pre-filter Report ---")
+    print(f"Input tokens:        {original_tokens} -> {kept_tokens} ({1 - kept_tokens / max(original_tokens, 1):.1%} fewer)")
+    print(f"Full text:           {full_time:.2f} s")
+    print(f"Pre-filtered:        {filtered_time:.2f} s (of which {1000 * filter_time:.1f} ms sentence scoring)")
+    print(f"Latency saving:      {full_time - filtered_time:.2f} s ({1 - filtered_time / full_time:.1%})")
+    print("------------------------------------")
+# ------------------------------
+
+# --- Bulk Article Summarisation ---
+def read_articles(path, text_field):
+    """Read articles from a .jsonl file, or from a text file where a blank line separates articles."""
+    with open(path, encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson"):
+            return [str(json.loads(line)[text_field]) for line in f if line.strip()]
+        return [article.strip() for article in re.split(r"\n\s*\n", f.read()) if article.strip()]
+
+
+def quantized_summarizer(base):
+    """
+    A CPU copy of the summarisation pipeline whose nn.Linear layers use dynamic
+    int8 quantization. The base pipeline's model is left where it is.
+    """
+    model = torch.quantization.quantize_dynamic(copy.deepcopy(base.model).cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("summarization", model=model, tokenizer=base.tokenizer, device=-1)
+
+
+def summarise_articles(pipe, articles, batch_size, max_length, min_length):
+    """
+    Summarise articles in length-bucketed batches and return the summaries in
+    input order. Sorting by token length first means each batch holds
+    articles of similar length, so little time is spent on padding.
+    """
+    lengths = [len(ids) for ids in pipe.tokenizer(articles, truncation=True)["input_ids"]]
+    order = sorted(range(len(articles)), key=lambda i: lengths[i])
+    summaries = [None] * len(articles)
+    padding = 0
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        padding += sum(max(lengths[i] for i in batch) - lengths[i] for i in batch)
+        results = pipe([articles[i] for i in batch], max_length=max_length, min_length=min_length,
+                       do_sample=False, truncation=True, batch_size=len(batch))
+        for i, result in zip(batch, results):
+            summaries[i] = result["summary_text"].strip()
+    return summaries, {"tokens": sum(lengths), "padding": padding}
+
+
+def rouge_tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def f1(overlap, reference_total, candidate_total):
+    if overlap == 0:
+        return 0.0
+    precision, recall = overlap / candidate_total, overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_n(reference, candidate, n):
+    ref = collections.Counter(tuple(reference[i:i + n]) for i in range(len(reference) - n + 1))
+    cand = collections.Counter(tuple(candidate[i:i + n]) for i in range(len(candidate) - n + 1))
+    return f1(sum((ref & cand).values()), sum(ref.values()), sum(cand.values()))
+
+
+def rouge_l(reference, candidate):
+    # Longest common subsequence, one row at a time
+    previous = [0] * (len(candidate) + 1)
+    for ref_token in reference:
+        current = [0]
+        for j, cand_token in enumerate(candidate):
+            current.append(previous[j] + 1 if ref_token == cand_token else max(previous[j + 1], current[j]))
+        previous = current
+    return f1(previous[-1], len(reference), len(candidate))
+
+
+def rouge_scores(references, candidates):
+    """Mean ROUGE-1, ROUGE-2 and ROUGE-L F1 of candidates against references."""
+    totals = collections.Counter()
+    for reference, candidate in zip(references, candidates):
+        ref, cand = rouge_tokens(reference), rouge_tokens(candidate)
+        totals["rouge1"] += rouge_n(ref, cand, 1)
+        totals["rouge2"] += rouge_n(ref, cand, 2)
+        totals["rougeL"] += rouge_l(ref, cand)
+    return {name: total / max(len(references), 1) for name, total in totals.items()}
+
+
+def run_bulk_articles(base, articles, max_length, min_length):
+    pipe = quantized_summarizer(base) if args.quantize else base
+    weights = "int8" if args.quantize else "fp32"
+    if args.extractive_budget:
+        filtered = [extractive_filter(article, base.tokenizer, args.extractive_budget) for article in articles]
+        articles = [text for text, _, _ in filtered]
+        original_tokens = sum(total for _, total, _ in filtered)
+        kept_tokens = sum(kept for _, _, kept in filtered)
+        print(f"\nExtractive pre-filter: {original_tokens} -> {kept_tokens} input tokens "
+              f"({1 - kept_tokens / max(original_tokens, 1):.1%} fewer)")
+    print(f"\nSummarising {len(articles)} articles with {weights} weights, batch size {args.batch_size}...")
+    start = time.perf_counter()
+    summaries, stats = summarise_articles(pipe, articles, args.batch_size, max_length, min_length)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for summary in summaries:
+                f.write(json.dumps({"summary": summary}, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(summaries)} summaries to {args.output}")
+    else:
+        print("\n--- Generated Summaries ---")
+        for i, summary in enumerate(summaries):
+            print(f"Article {i + 1}: {summary}")
+        print("---------------------------")
+    print(f"\nSummarised {len(articles)} articles in {elapsed:.2f} s ({len(articles) / elapsed:.2f} articles/sec), "
+          f"padding {stats['padding'] / (stats['padding'] + stats['tokens']):.1%} of input positions.")
+
+
+def run_quantization_comparison(base, articles, max_length, min_length):
+    """Summarise a sample with fp32 and int8 weights; report articles/sec and ROUGE of int8 against fp32."""
+    sample = articles[:args.compare_sample]
+    print(f"\nComparing fp32 and int8 weights on {len(sample)} articles, batch size {args.batch_size}...")
+    results = {}
+    # The int8 copy is only built once the fp32 run is done
+    for weights, make_pipe in (("fp32", lambda: base), ("int8", lambda: quantized_summarizer(base))):
+        pipe = make_pipe()
+        start = time.perf_counter()
+        summaries, _ = summarise_articles(pipe, sample, args.batch_size, max_length, min_length)
+        results[weights] = (summaries, time.perf_counter() - start)
+    scores = rouge_scores(results["fp32"][0], results["int8"][0])
+    print("\n--- Quantization Report ---")
+    for weights, (_, seconds) in results.items():
+        print(f"{weights + ':':<9} {seconds:.2f} s ({len(sample) / seconds:.2f} articles/sec)")
+    print(f"Speed-up: {results['fp32'][1] / results['int8'][1]:.2f}x")
+    print(f"ROUGE of int8 against fp32 summaries: ROUGE-1 {scores['rouge1']:.3f}, "
+          f"ROUGE-2 {scores['rouge2']:.3f}, ROUGE-L {scores['rougeL']:.3f} (1.000 = identical)")
+    print("---------------------------")
+# -----------------------------------
+
 # 1. Load the summarization pipeline, explicitly specifying the BART model
 print("Loading summarization model (may download on first run)...")
 try:
@@ -38,6 +402,9 @@ Public transport users on Transperth services also faced minor delays on some bu
 Authorities are advising motorists heading out of the city for the weekend or just beginning their afternoon commute to allow for extra travel time, check live traffic updates via the Main Roads website, and consider alternative routes or delaying non-essential travel until after the peak period, expected around 4:00 PM to 5:30 PM AWST.
 Event organisers reminded attendees for tonight's concert at RAC Arena to factor potential traffic delays into their travel plans.
 """
+if args.document:
+    with open(args.document, encoding="utf-8") as f:
+        text_to_summarize = f.read()
 
 print(f"\nOriginal Text Length: {len(text_to_summarize)} characters")
 # print(f"Original Text:\n\"{text_to_summarize}\"") # Uncomment to see the full original text
@@ -48,6 +415,34 @@ print(f"\nOriginal Text Length: {len(text_to_summarize)} characters")
 min_summary_len = 30  # Minimum number of tokens in the summary
 max_summary_len = 130 # Maximum number of tokens in the summary
 
+if args.articles:
+    try:
+        articles = read_articles(args.articles, args.text_field)
+        if args.compare:
+            run_quantization_comparison(summarizer, articles, max_summary_len, min_summary_len)
+        else:
+            run_bulk_articles(summarizer, articles, max_summary_len, min_summary_len)
+    except Exception as e:
+        print(f"Error during summarization: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.extractive_budget:
+    try:
+        run_extractive_comparison(text_to_summarize, max_summary_len, min_summary_len)
+    except Exception as e:
+        print(f"Error during summarization: {e}")
+    print("\nExample finished.")
+    exit()
+
+if args.long_document:
+    try:
+        run_long_document(text_to_summarize, max_summary_len, min_summary_len)
+    except Exception as e:
+        print(f"Error during summarization: {e}")
+    print("\nExample finished.")
+    exit()
+
 print(f"\nGenerating summary (min length: {min_summary_len}, max length: {max_summary_len})...")
 
 # 4. Run the summarization pipeline
@@ -1,6 +1,15 @@
 # Import the pipeline function and torch
 from transformers import pipeline
 import torch
+import argparse
+import collections
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 print("-------------------------------------------")
 print("Hugging Face Local Inference Example")
@@ -8,6 +17,276 @@ print("Task: Translation (English to French)")
 print("Model: Helsinki-NLP/opus-mt-en-fr")
 print("-------------------------------------------")
 
+# --- Command-line Options ---
+# With no arguments the script runs the original single-sentence example below.
+parser = argparse.ArgumentParser(description="Local English-to-French translation example.")
+parser.add_argument("--document", help="Translate this text file sentence by sentence, keeping its layout.")
+parser.add_argument("--output", help="Where to write the translated --document (default: print it).")
+parser.add_argument("--memory", help="SQLite file used as a translation memory, consulted before the model and created if missing (default: no memory).")
+parser.add_argument("--batch-size", type=int, default=16, help="Sentences translated per model call (default: 16).")
+parser.add_argument("--languages", help="Comma-separated target languages, e.g. fr,de,es: translate the text (or --document) into each with Helsinki-NLP/opus-mt-en-<lang>.")
+parser.add_argument("--max-loaded-models", type=int, default=3, help="Models kept in memory at once for --languages; the least recently used is unloaded first (default: 3).")
+parser.add_argument("--workers", type=int, help="Languages translated in parallel threads for --languages, at most --max-loaded-models (default: --max-loaded-models).")
+args = parser.parse_args()
+# ----------------------------
+
+model_name = "Helsinki-NLP/opus-mt-en-fr"
+
+# --- Document Translation ---
+# A sentence ends at . ! or ? followed by whitespace; line breaks always end one.
+# The separators are kept so the translated document has the same layout.
+SENTENCE_BREAK = re.compile(r"((?<=[.!?])[ \t]+|\s*\n\s*)")
+
+
+class TranslationMemory:
+    """
+    Exact-match translation memory in a SQLite file.
+
+    Entries are keyed by a SHA-1 hash of the model name and the source
+    sentence, so the same file can serve several models and lookups never
+    compare long strings.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()  # one connection shared by the fan-out threads
+        self.connection.execute("CREATE TABLE IF NOT EXISTS memory (key TEXT PRIMARY KEY, source TEXT, translation TEXT)")
+
+    @staticmethod
+    def key(model, sentence):
+        return hashlib.sha1(f"{model}\n{sentence}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, sentences):
+        """Return {sentence: translation} for the sentences already in memory."""
+        found = {}
+        sentences = list(sentences)
+        for start in range(0, len(sentences), 500):
+            chunk = {self.key(model, sentence): sentence for sentence in sentences[start:start + 500]}
+            with self.lock:
+                rows = self.connection.execute(
+                    f"SELECT key, translation FROM memory WHERE key IN ({','.join('?' * len(chunk))})", list(chunk)).fetchall()
+            found.update((chunk[key], translation) for key, translation in rows)
+        return found
+
+    def put_many(self, model, pairs):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO memory VALUES (?, ?, ?)",
+                                        [(self.key(model, source), source, target) for source, target in pairs])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def split_document(text):
+    """Split text into alternating [sentence, separator, sentence, ...] segments."""
+    return SENTENCE_BREAK.split(text)
+
+
+def translate_sentences(pipe, model, sentences, memory, batch_size):
+    """
+    Translate a list of sentences and return the translations in the same order.
+
+    Each distinct sentence is translated once: the translation memory is
+    consulted first, and the remaining sentences are sorted by token length
+    and translated batch_size at a time, so each batch needs little padding.
+    New translations are added to the memory.
+    """
+    unique = list(dict.fromkeys(sentences))
+    known = memory.get_many(model, unique) if memory is not None else {}
+    missing = [sentence for sentence in unique if sentence not in known]
+    start = time.perf_counter()
+    new = []
+    if missing:
+        # Tokenize once; the same ids give the sort order and the batches
+        encoded = pipe.tokenizer(missing, truncation=True)["input_ids"]
+        order = sorted(range(len(missing)), key=lambda i: len(encoded[i]))
+        for batch_start in range(0, len(order), batch_size):
+            batch = order[batch_start:batch_start + batch_size]
+            inputs = pipe.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt").to(pipe.model.device)
+            with torch.no_grad():
+                outputs = pipe.model.generate(**inputs)
+            texts = pipe.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            new.extend((missing[i], text.strip()) for i, text in zip(batch, texts))
+    model_time = time.perf_counter() - start
+    if memory is not None and new:
+        memory.put_many(model, new)
+    known.update(new)
+    stats = {"sentences": len(sentences), "unique": len(unique), "memory_hits": len(unique) - len(missing),
+             "translated": len(missing), "model_time": model_time}
+    return [known[sentence] for sentence in sentences], stats
+
+
+def translate_document(pipe, model, text, memory, batch_size):
+    """Translate text sentence by sentence and reassemble it with the original separators."""
+    segments = split_document(text)
+    positions = [i for i in range(0, len(segments), 2) if segments[i].strip()]
+    translations, stats = translate_sentences(pipe, model, [segments[i] for i in positions], memory, batch_size)
+    for i, translation in zip(positions, translations):
+        segments[i] = translation
+    return "".join(segments), stats
+
+
+def run_document_mode(pipe):
+    with open(args.document, encoding="utf-8") as f:
+        text = f.read()
+    memory = TranslationMemory(args.memory) if args.memory else None
+    print(f"\nTranslating '{args.document}' ({len(text)} characters), batch size {args.batch_size}"
+          + ("" if memory is None else f", translation memory '{args.memory}' ({len(memory)} entries)") + "...")
+    try:
+        start = time.perf_counter()
+        translated, stats = translate_document(pipe, model_name, text, memory, args.batch_size)
+        elapsed = time.perf_counter() - start
+    finally:
+        if memory is not None:
+            memory.close()
+    print("Translation complete.")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(translated)
+        print(f"Wrote the translation to {args.output}")
+    else:
+        print("\n--- Generated French Translation ---")
+        print(translated)
+        print("----------------------------------")
+    hit_rate = stats["memory_hits"] / max(stats["unique"], 1)
+    print("\n--- Document Translation Report ---")
+    print(f"Sentences:           {stats['sentences']} ({stats['unique']} distinct)")
+    print(f"Memory hits:         {stats['memory_hits']} ({hit_rate:.1%} of distinct sentences)")
+    print(f"Model translations:  {stats['translated']} in {stats['model_time']:.2f} s")
+    print(f"Total time:          {elapsed:.2f} s ({stats['sentences'] / elapsed:.1f} sentences/sec)")
+    print("-----------------------------------")
+# ----------------------------
+
+# --- Multi-language Fan-out ---
+class ModelPool:
+    """
+    Translation pipelines loaded on first use and kept for reuse, at most
+    max_models at a time; when a new one is needed the least recently used
+    is dropped. Safe to use from several threads. Loading is done one model
+    at a time (transformers' model loading is not thread-safe), and a model
+    is loaded only once even if several threads ask for it together.
+    get() pins the model until the caller release()s it, and pinned models
+    are never dropped, so a model is not unloaded while a thread is still
+    translating with it (which would keep it in memory anyway).
+    """
+
+    def __init__(self, max_models):
+        self.max_models = max_models
+        self.models = collections.OrderedDict()  # model name -> pipeline
+        self.pins = collections.Counter()  # model name -> threads using it
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.loads = self.evictions = 0
+
+    def add(self, name, pipe):
+        with self.lock:
+            self.models[name] = pipe
+            self.evict()
+
+    def get(self, name):
+        """Return the pipeline for name, loading it if needed, pinned until release(name)."""
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                self.pins[name] += 1
+                return self.models[name]
+        with self.load_lock:
+            with self.lock:
+                if name in self.models:
+                    self.models.move_to_end(name)
+                    self.pins[name] += 1
+                    return self.models[name]
+            pipe = pipeline("translation", model=name, device=0 if torch.cuda.is_available() else -1)
+            with self.lock:
+                self.models[name] = pipe
+                self.pins[name] += 1
+                self.loads += 1
+                self.evict()
+        return pipe
+
+    def release(self, name):
+        with self.lock:
+            self.pins[name] -= 1
+            if self.pins[name] <= 0:
+                del self.pins[name]
+            self.evict()
+
+    def evict(self):
+        # Least recently used first, skipping pinned models; with every model pinned the pool stays over its limit until a release
+        unpinned = [name for name in self.models if not self.pins[name]]
+        for name in unpinned[:max(len(self.models) - self.max_models, 0)]:
+            del self.models[name]
+            self.evictions += 1
+
+
+def language_output_path(path, language):
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{language}{extension}"
+
+
+def run_fan_out(pool, text):
+    """Translate text into every --languages target in parallel threads and report per-language and wall time."""
+    languages = [language.strip() for language in args.languages.split(",") if language.strip()]
+    # Each worker pins one model at a time, so more workers than loaded models would break the memory bound
+    workers = min(args.workers or len(languages), args.max_loaded_models, len(languages))
+    memory = TranslationMemory(args.memory) if args.memory else None
+    # Segment the source once; every language translates the same sentence list
+    segments = split_document(text)
+    positions = [i for i in range(0, len(segments), 2) if segments[i].strip()]
+    sentences = [segments[i] for i in positions]
+    print(f"\nTranslating {len(sentences)} sentences into {', '.join(languages)} "
+          f"with {workers} worker threads, at most {args.max_loaded_models} models loaded...")
+
+    def translate_to(language):
+        name = f"Helsinki-NLP/opus-mt-en-{language}"
+        start = time.perf_counter()
+        pipe = pool.get(name)
+        load_time = time.perf_counter() - start
+        try:
+            translations, stats = translate_sentences(pipe, name, sentences, memory, args.batch_size)
+        finally:
+            pool.release(name)
+        translated = list(segments)
+        for i, translation in zip(positions, translations):
+            translated[i] = translation
+        stats["load_time"] = load_time
+        stats["time"] = time.perf_counter() - start
+        return "".join(translated), stats
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(languages, executor.map(translate_to, languages)))
+    finally:
+        if memory is not None:
+            memory.close()
+    wall_time = time.perf_counter() - start
+    print("Translation complete.")
+
+    for language, (translated, _) in results.items():
+        if args.output:
+            path = language_output_path(args.output, language)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(translated)
+            print(f"Wrote the {language} translation to {path}")
+        else:
+            print(f"\n--- Translation ({language}) ---")
+            print(translated)
+    print("\n--- Fan-out Translation Report ---")
+    print(f"{'Language':<10}{'Seconds':>9}{'Loading':>9}{'Model':>9}{'Memory hits':>13}")
+    for language, (_, stats) in results.items():
+        print(f"{language:<10}{stats['time']:>9.2f}{stats['load_time']:>9.2f}{stats['model_time']:>9.2f}"
+              f"{stats['memory_hits']:>8}/{stats['unique']:<4}")
+    slowest = max(stats["time"] for _, stats in results.values())
+    total = sum(stats["time"] for _, stats in results.values())
+    print(f"Wall time:           {wall_time:.2f} s (slowest language {slowest:.2f} s, all languages added up {total:.2f} s)")
+    print(f"Model pool:          {pool.loads} loads, {pool.evictions} evictions")
+    print("----------------------------------")
+# ------------------------------
+
 # 1. Load the translation pipeline
 #    - Specify the task as "translation_xx_to_yy" where xx/yy are language codes.
 #    - Explicitly provide the Helsinki-NLP model name.
@@ -16,7 +295,7 @@ try:
     # Note the task format: translation_{source_lang}_to_{target_lang}
     translator = pipeline(
         "translation_en_to_fr", # Task for English to French
-        model="Helsinki-NLP/opus-mt-en-fr", # Explicit model name
+        model=model_name, # Explicit model name (Helsinki-NLP/opus-mt-en-fr)
         device=0 if torch.cuda.is_available() else -1 # Use GPU if available, else CPU
         )
     print("Model loaded successfully.")
@@ -30,6 +309,14 @@ except Exception as e:
     print("Please ensure 'transformers', 'sentencepiece', and 'torch' (or 'tensorflow') are installed.")
     exit()
 
+if args.document and not args.languages:
+    try:
+        run_document_mode(translator)
+    except Exception as e:
+        print(f"Error during translation: {e}")
+    print("\nExample finished.")
+    exit()
+
 # 2. Define the English text you want to translate
 #    Using context relevant to Friday afternoon in Perth
 text_to_translate = "It is a beautiful Friday afternoon here in Perth, Western Australia. Perhaps I will go for a walk by the Swan River later today."
@@ -37,6 +324,20 @@ text_to_translate = "It is a beautiful Friday afternoon here in Perth, Western A
 print(f"\nOriginal English Text:\n\"{text_to_translate}\"")
 
 
+if args.languages:
+    try:
+        pool = ModelPool(args.max_loaded_models)
+        pool.add(model_name, translator)
+        text = text_to_translate
+        if args.document:
+            with open(args.document, encoding="utf-8") as f:
+                text = f.read()
+        run_fan_out(pool, text)
+    except Exception as e:
+        print(f"Error during translation: {e}")
+    print("\nExample finished.")
+    exit()
+
 # 3. Run the translation pipeline
 print("\nTranslating to French...")
 try: